@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+
+class CumulativeStats:
+    def __init__(self, df):
+        # Rows ordered by GW, so a larger row position never means an earlier GW
+        self.df = df.sort_values('GW', kind='stable').reset_index(drop=True)
+        self.stats = [col for col in self.df.select_dtypes(['number', 'bool']).columns if col != 'GW']
+        self._stat_positions = {stat: i for i, stat in enumerate(self.stats)}
+
+        player_codes, self.players = pd.factorize(self.df['name'], sort=True)
+        gws = self.df['GW'].to_numpy()
+        self.min_gw = int(gws.min())
+        self.max_gw = int(gws.max())
+        gw_codes = gws - self.min_gw
+        num_players, num_gws = len(self.players), self.max_gw - self.min_gw + 1
+
+        # player x GW x stat running totals, with a leading zero GW so a window
+        # sum is always cube[:, end] - cube[:, start]
+        values = np.nan_to_num(self.df[self.stats].to_numpy(dtype='float64'))
+        self.cube = np.zeros((num_players, num_gws + 1, len(self.stats)))
+        np.add.at(self.cube, (player_codes, gw_codes + 1), values)
+        np.cumsum(self.cube, axis=1, out=self.cube)
+
+        # Row position of each player's latest row at or before each GW, -1 if none
+        self.latest_rows = np.full((num_players, num_gws), -1, dtype='int64')
+        np.maximum.at(self.latest_rows, (player_codes, gw_codes), np.arange(len(self.df)))
+        np.maximum.accumulate(self.latest_rows, axis=1, out=self.latest_rows)
+        self._gws = gws
+
+    def _bounds(self, start_gw, end_gw):
+        start = min(max(int(start_gw), self.min_gw), self.max_gw + 1) - self.min_gw
+        end = min(max(int(end_gw), self.min_gw - 1), self.max_gw) - self.min_gw + 1
+        return start, max(start, end)
+
+    def has_stats(self, stats):
+        return all(stat in self._stat_positions for stat in stats)
+
+    def window_sum(self, start_gw, end_gw, stats):
+        # players x stats totals over [start_gw, end_gw]
+        start, end = self._bounds(start_gw, end_gw)
+        positions = [self._stat_positions[stat] for stat in stats]
+        return self.cube[:, end, positions] - self.cube[:, start, positions]
+
+    def latest_rows_in_window(self, start_gw, end_gw):
+        # Row position of each player's latest row inside the window, -1 if absent
+        start, end = self._bounds(start_gw, end_gw)
+        if start == end:
+            return np.full(len(self.players), -1, dtype='int64')
+        rows = self.latest_rows[:, end - 1]
+        in_window = (rows >= 0) & (self._gws[rows] >= start + self.min_gw)
+        return np.where(in_window, rows, -1)
+
+    def window_frame(self, start_gw, end_gw, sum_columns, latest_columns):
+        # One row per player seen in the window, latest values then summed stats
+        rows = self.latest_rows_in_window(start_gw, end_gw)
+        present = rows >= 0
+        frame = self.df[latest_columns].iloc[rows[present]].reset_index(drop=True)
+        frame.index = self.players[present]
+
+        sums = self.window_sum(start_gw, end_gw, sum_columns)[present]
+        for i, col in enumerate(sum_columns):
+            frame[col] = sums[:, i]
+            # Keep integer stats integer when every row was an integer
+            if pd.api.types.is_integer_dtype(self.df[col]) or pd.api.types.is_bool_dtype(self.df[col]):
+                frame[col] = frame[col].astype('int64')
+        return frame
+
+
+def get_cumulative_stats(data):
+    return data.derived('cumulative_stats', CumulativeStats)
@@ -1,4 +1,8 @@
 import dash
+import instrumentation
 
 app = dash.Dash(__name__, suppress_callback_exceptions=True)
 server = app.server  # Expose the server for deployment
+
+# No-op unless FPL_INSTRUMENT=1, must run before callbacks are registered
+instrumentation.install(app)
@@ -0,0 +1,81 @@
+/* Clientside rendering of the graphs grid from the series in graph-series-store */
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    fpl: {
+        renderGraphs: function(series, numCols, selectedPlayers, selectedStats) {
+            var players = [].concat(selectedPlayers || []);
+            var stats = [].concat(selectedStats || []);
+
+            if (!series || !players.length || !stats.length) {
+                return {
+                    type: 'Graph',
+                    namespace: 'dash_core_components',
+                    props: {
+                        figure: {
+                            data: [],
+                            layout: {
+                                title: 'No Data to Display',
+                                xaxis: {title: 'Game Week'},
+                                yaxis: {title: 'Statistic'}
+                            }
+                        }
+                    }
+                };
+            }
+
+            if (!numCols || numCols < 1) {
+                numCols = 2;
+            }
+
+            var graphs = stats.map(function(stat) {
+                var traces = players.filter(function(player) {
+                    return series.players[player] && series.players[player][stat];
+                }).map(function(player) {
+                    return {
+                        type: 'scattergl',
+                        mode: 'lines+markers',
+                        name: player,
+                        x: series.players[player].GW,
+                        y: series.players[player][stat]
+                    };
+                });
+                var title = series.lookback ? 'Trailing Avg (' + series.lookback + ' GW) of ' + stat : stat;
+
+                return {
+                    type: 'Div',
+                    namespace: 'dash_html_components',
+                    props: {
+                        className: 'grid-item',
+                        children: {
+                            type: 'Graph',
+                            namespace: 'dash_core_components',
+                            props: {
+                                figure: {
+                                    data: traces,
+                                    layout: {
+                                        title: {text: title},
+                                        xaxis: {title: {text: 'Game Week'}},
+                                        yaxis: {title: {text: stat}},
+                                        legend: {title: {text: 'Players'}}
+                                    }
+                                }
+                            }
+                        }
+                    }
+                };
+            });
+
+            return {
+                type: 'Div',
+                namespace: 'dash_html_components',
+                props: {
+                    style: {
+                        display: 'grid',
+                        gridTemplateColumns: 'repeat(' + numCols + ', 1fr)',
+                        gridGap: '10px'
+                    },
+                    children: graphs
+                }
+            };
+        }
+    }
+});
@@ -0,0 +1,228 @@
+"""Offline latency and memory benchmarks for data_handler and the callbacks.
+
+    python benchmark.py --players 800 --gws 38 --seasons 2 --save baseline.json
+    python benchmark.py --compare baseline.json
+
+Synthetic seasons are written to a temporary directory and registered as
+local seasons, so nothing is fetched from GitHub.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+POSITIONS = ['GK', 'DEF', 'MID', 'FWD']
+
+
+def synthetic_season(num_players, num_gws, seed=0, double_gw_every=10):
+    # One row per player per GW with merged_gw.csv's columns, plus a second
+    # fixture for a third of the players every double_gw_every GWs
+    rng = np.random.default_rng(seed)
+    players = np.arange(num_players)
+    frames = []
+    for gw in range(1, num_gws + 1):
+        rows = players[rng.random(num_players) > 0.05]
+        if double_gw_every and gw % double_gw_every == 0:
+            rows = np.concatenate([rows, rows[rows % 3 == 0]])
+        frames.append(pd.DataFrame({'element': rows + 1, 'GW': gw}))
+    df = pd.concat(frames, ignore_index=True)
+    n, element = len(df), df['element'].to_numpy() - 1
+
+    df['name'] = np.where(element == 0, 'Erling Haaland', 'Player ' + element.astype(str))
+    df['position'] = np.array(POSITIONS)[element % 4]
+    df['team'] = 'Team ' + (element % 20).astype(str)
+    df['opponent_team'] = rng.integers(1, 21, n)
+    df['kickoff_time'] = '2023-08-11T19:00:00Z'
+    df['round'] = df['GW']
+    df['fixture'] = df['GW'] * 10 + element % 10
+    df['was_home'] = rng.integers(0, 2, n).astype(bool)
+    df['minutes'] = rng.choice([0, 45, 90], n)
+    df['starts'] = (df['minutes'] > 0).astype(int)
+    for col, high in [('assists', 2), ('bonus', 4), ('bps', 40), ('clean_sheets', 2), ('goals_conceded', 4),
+                      ('goals_scored', 2), ('own_goals', 1), ('penalties_missed', 1), ('penalties_saved', 1),
+                      ('red_cards', 1), ('yellow_cards', 2), ('saves', 5), ('team_a_score', 4), ('team_h_score', 4)]:
+        df[col] = rng.integers(0, high, n)
+    for col, scale in [('xP', 8), ('creativity', 50), ('ict_index', 15), ('influence', 60), ('threat', 80)]:
+        df[col] = (rng.random(n) * scale).round(1)
+    for col in ['expected_assists', 'expected_goal_involvements', 'expected_goals', 'expected_goals_conceded']:
+        df[col] = rng.random(n).round(2)
+    df['total_points'] = rng.integers(-1, 15, n)
+    df['value'] = 40 + element % 90 + df['GW'] // 10
+    df['selected'] = rng.integers(1000, 5_000_000, n)
+    df['transfers_in'] = rng.integers(0, 100_000, n)
+    df['transfers_out'] = rng.integers(0, 100_000, n)
+    df['transfers_balance'] = df['transfers_in'] - df['transfers_out']
+    return df.sort_values(['GW', 'element'], kind='stable').reset_index(drop=True)
+
+
+def write_seasons(directory, num_players, num_gws, num_seasons):
+    seasons = [f'{2023 - i}-{(24 - i) % 100:02d}' for i in range(num_seasons)]
+    for i, season in enumerate(seasons):
+        path = os.path.join(directory, season, 'gws')
+        os.makedirs(path)
+        synthetic_season(num_players, num_gws, seed=i).to_csv(os.path.join(path, 'merged_gw.csv'), index=False)
+    return seasons
+
+
+def measure(fn, repeat):
+    fn()  # Warm up lazily built indexes so they don't skew the first sample
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    quantiles = statistics.quantiles(timings, n=100) if len(timings) > 1 else timings * 99
+    return {
+        'p50_ms': statistics.median(timings),
+        'p95_ms': quantiles[94],
+        'p99_ms': quantiles[98],
+        'peak_kib': peak / 1024,
+    }
+
+
+def benchmark_cases(season):
+    # Imported here so the environment pointing at the synthetic seasons is
+    # in place before the app modules load
+    import callbacks
+    import data_handler
+    from aggregates import get_cumulative_stats
+    from layouts import selected_columns
+    from optimiser import optimise_squad, player_pool
+    from seasons import get_dataset
+
+    data = get_dataset(season)
+    df = data.df
+    cumulative = get_cumulative_stats(data)
+    players = sorted(df['name'].unique())
+    max_gw = int(df['GW'].max())
+    cases = {}
+
+    for num_weeks in [1, 4, 10, max_gw]:
+        for position in POSITIONS:
+            cases[f'get_best_performers_by_points weeks={num_weeks} {position}'] = \
+                lambda n=num_weeks, p=position: data_handler.get_best_performers_by_points(df, n, [p], cumulative)
+            cases[f'get_best_performers_by_value weeks={num_weeks} {position}'] = \
+                lambda n=num_weeks, p=position: data_handler.get_best_performers_by_value(df, n, [p], cumulative)
+        cases[f'get_largest_price_changes weeks={num_weeks}'] = \
+            lambda n=num_weeks: data_handler.get_largest_price_changes(df, n)
+        cases[f'get_largest_ownership_changes weeks={num_weeks}'] = \
+            lambda n=num_weeks: data_handler.get_largest_ownership_changes(df, n)
+
+    for objective in ['points', 'xP', 'value']:
+        cases[f'optimise_squad {objective}'] = \
+            lambda o=objective: optimise_squad(player_pool(cumulative, 1, max_gw, o))
+
+    value_min, value_max = int(df['value'].min()), int(df['value'].max())
+    table_grid = {
+        'default': (['name', 'team', 'value', 'total_points'], [value_min, value_max], [1, max_gw], ['GK']),
+        'wide': (['name', 'team', 'value', 'position', 'total_points', 'minutes', 'xP', 'bps', 'ict_index',
+                  'threat', 'creativity', 'influence', 'goals_scored', 'assists'],
+                 [value_min, value_max], [1, max_gw], POSITIONS),
+        'value-filtered': (['name', 'team', 'value', 'total_points', 'minutes'],
+                           [value_min + 10, value_max - 10], [max_gw // 2, max_gw], ['MID', 'FWD']),
+    }
+    for label, (columns, value_range, GW_range, positions) in table_grid.items():
+        # Cleared every call so each sample pays for the aggregation
+        def run_table(columns=columns, value_range=value_range, GW_range=GW_range, positions=positions):
+            callbacks.table_cache.clear()
+            return callbacks.update_table(columns, value_range, GW_range, positions, 'total_points', 'desc',
+                                          0, 25, [], '', season)
+        cases[f'update_table {label}'] = run_table
+
+    graph_grid = {
+        '1x1': (players[:1], ['total_points'], None, []),
+        '10x10': (players[:10], selected_columns[:10], None, []),
+        '10x10 trailing': (players[:10], selected_columns[:10], 5, ['ON']),
+    }
+    for label, (selected_players, stats, lookback, toggle) in graph_grid.items():
+        # Likewise for the figure cache, or every sample after the first is a hit
+        def run_graphs(selected_players=selected_players, stats=stats, lookback=lookback, toggle=toggle):
+            callbacks.graph_grid.cache_clear()
+            return callbacks.update_graphs(selected_players, stats, lookback, toggle, 2, season)
+        cases[f'update_graphs {label}'] = run_graphs
+    return cases
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None or 'error' in result or 'error' in before:
+            continue
+        if result['p50_ms'] > before['p50_ms'] * (1 + threshold):
+            regressions.append(f'{name}: p50 {before["p50_ms"]:.2f} -> {result["p50_ms"]:.2f} ms')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=800)
+    parser.add_argument('--gws', type=int, default=38)
+    parser.add_argument('--seasons', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--filter', default='', help='only run cases containing this text')
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare p50 latencies against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed p50 slowdown, 0.2 is 20%%')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='fpl-bench-')
+    seasons = write_seasons(directory, args.players, args.gws, args.seasons)
+    os.environ.update({
+        'FPL_DATA_DIR': directory,
+        'FPL_SEASONS': '',
+        'FPL_DEFAULT_SEASON': seasons[0],
+        'FPL_SNAPSHOT_DIR': os.path.join(directory, 'snapshots'),
+        'FPL_REFRESH_INTERVAL': '0',
+    })
+
+    results = {}
+    for season in seasons:
+        for name, fn in benchmark_cases(season).items():
+            name = f'{name} [{season}]' if len(seasons) > 1 else name
+            if args.filter not in name:
+                continue
+            try:
+                results[name] = measure(fn, args.repeat)
+            except Exception as e:
+                results[name] = {'error': repr(e)}
+
+    print(f'{"case":<60} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"peak KiB":>10}')
+    for name, result in results.items():
+        if 'error' in result:
+            print(f'{name:<60} error: {result["error"]}')
+        else:
+            print(f'{name:<60} {result["p50_ms"]:>9.2f} {result["p95_ms"]:>9.2f} '
+                  f'{result["p99_ms"]:>9.2f} {result["peak_kib"]:>10.0f}')
+
+    shutil.rmtree(directory, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print('REGRESSION', line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
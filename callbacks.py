@@ -1,24 +1,43 @@
+import os
+from functools import lru_cache
 from dash.dependencies import Input, Output, State
 from app import app
-from layouts import graphs_tab, tables_tab, overview_tab, df  # Import the DataFrame
-import plotly.graph_objs as go
-from dash import html, dcc
+from layouts import graphs_tab, tables_tab, overview_tab, squad_tab
+from dash import html, dcc, Patch, ClientsideFunction
 from dash.exceptions import PreventUpdate
-import pandas as pd
-from data_handler import get_best_performers_by_points, get_best_performers_by_value, get_largest_price_changes, get_largest_ownership_changes
+import numpy as np
+from aggregates import get_cumulative_stats
+from data_handler import aggregate_table, get_overview_tables, get_table_page
+from movers import get_movers
+from optimiser import OBJECTIVES, optimise_squad, player_pool
+from player_index import get_player_index
+from result_cache import ResultCache
+from seasons import get_dataset
+from similarity import get_similarity_index
+from rolling_stats import get_rolling_stats
 
 
 @app.callback(
     Output('tabs-content', 'children'),
-    [Input('tabs', 'value')]
+    [Input('tabs', 'value'),
+     Input('season-select', 'value')]
 )
-def render_content(tab):
+def render_content(tab, season=None):
+    # Re-rendering on a season change resets the controls to that season's ranges
+    return tab_layout(tab, season, get_dataset(season).version)
+
+
+@lru_cache(maxsize=32)
+def tab_layout(tab, season, version):
+    # Layouts only change with the data, so every session shares one per version
     if tab == 'tab-graphs':
-        return graphs_tab()  # Use the function from layouts.py
+        return graphs_tab(season)  # Use the function from layouts.py
     elif tab == 'tab-tables':
-        return tables_tab()
+        return tables_tab(season)
     elif tab == 'tab-overview':
         return overview_tab()
+    elif tab == 'tab-squad':
+        return squad_tab(season)
 
 
 @app.callback(
@@ -39,13 +58,28 @@ def toggle_input_box(toggle_value):
         Input('trailing-lookback', 'value'),
         Input('toggle-trailing', 'value'),
         Input('num-cols-input', 'value')
-    ]
+    ],
+    [State('season-select', 'value')]
 )
-def update_graphs(selected_players, selected_stats, lookback, toggle_value, num_cols):
+def update_graphs(selected_players, selected_stats, lookback, toggle_value, num_cols, season=None):
     # Ensure selected_stats is a list even if it's a single selection
     if not isinstance(selected_stats, list):
         selected_stats = [selected_stats]
-    
+    # The dropdown's default value is a single name rather than a list
+    if not isinstance(selected_players, list):
+        selected_players = [selected_players] if selected_players else []
+    if not ('ON' in (toggle_value or []) and lookback is not None and lookback > 0):
+        lookback = None
+
+    return graph_grid(tuple(selected_players), tuple(selected_stats), lookback, num_cols,
+                      season, get_dataset(season).version)
+
+
+@lru_cache(maxsize=64)
+def graph_grid(selected_players, selected_stats, lookback, num_cols, season, version):
+    # graph_objs takes a while to import, so it waits for the first graph
+    import plotly.graph_objs as go
+
     if not selected_players or not selected_stats:
         return html.Div([
             dcc.Graph(
@@ -70,23 +104,26 @@ def update_graphs(selected_players, selected_stats, lookback, toggle_value, num_
 
     # Create a list to store the graph components
     graphs = []
+    data = get_dataset(season)
+    player_index = get_player_index(data)
+    rolling_stats = get_rolling_stats(data)
 
     for stat in selected_stats:
         fig = go.Figure()
 
         for player in selected_players:
-            filtered_df = df[df['name'] == player]
+            y = player_index.values(player, stat)
 
             # Apply trailing average if enabled and a valid lookback is provided
-            if 'ON' in toggle_value and lookback is not None and lookback > 0:
-                filtered_df[stat] = filtered_df[stat].rolling(window=lookback, min_periods=1).mean()
+            if lookback is not None:
+                y = rolling_stats.values(player, stat, lookback)
                 title = f'Trailing Avg ({lookback} GW) of {stat}'
             else:
                 title = f'{stat}'
 
             fig.add_trace(go.Scatter(
-                x=filtered_df['GW'], 
-                y=filtered_df[stat],
+                x=player_index.values(player, 'GW'),
+                y=y,
                 mode='lines+markers',
                 name=player
             ))
@@ -111,6 +148,141 @@ def update_graphs(selected_players, selected_stats, lookback, toggle_value, num_
 
     return html.Div(graphs, style=grid_style)
 
+def player_series(player_index, rolling_stats, player, stats, lookback):
+    series = {'GW': player_index.values(player, 'GW').tolist()}
+    for stat in stats:
+        if lookback:
+            series[stat] = rolling_stats.values(player, stat, lookback).tolist()
+        else:
+            series[stat] = player_index.values(player, stat).tolist()
+    return series
+
+@app.callback(
+    [Output('graph-series-store', 'data'),
+     Output('graph-series-keys', 'data')],
+    [
+        Input('player-dropdown', 'value'),
+        Input('stat-dropdown', 'value'),
+        Input('trailing-lookback', 'value'),
+        Input('toggle-trailing', 'value')
+    ],
+    [State('graph-series-keys', 'data'),
+     State('season-select', 'value')]
+)
+def update_graph_series(selected_players, selected_stats, lookback, toggle_value, keys, season=None):
+    # Clientside mode: keep the browser's store of per-player series in step
+    # with the selection, patching in only what was added or removed
+    selected_players = [p for p in (selected_players if isinstance(selected_players, list) else [selected_players]) if p]
+    selected_stats = [s for s in (selected_stats if isinstance(selected_stats, list) else [selected_stats]) if s]
+    if not ('ON' in (toggle_value or []) and lookback is not None and lookback > 0):
+        lookback = None
+
+    data = get_dataset(season)
+    player_index = get_player_index(data)
+    rolling_stats = get_rolling_stats(data)
+    # The fingerprint rather than the version, as the next request may be
+    # served by another worker process with its own version numbers
+    new_keys = {'season': season, 'fingerprint': data.fingerprint(), 'lookback': lookback,
+                'players': selected_players, 'stats': selected_stats}
+
+    if not keys or any(keys.get(key) != new_keys[key] for key in ('season', 'fingerprint', 'lookback')):
+        series = {player: player_series(player_index, rolling_stats, player, selected_stats, lookback)
+                  for player in selected_players}
+        return {'lookback': lookback, 'players': series}, new_keys
+
+    patch = Patch()
+    for player in set(keys['players']) - set(selected_players):
+        del patch['players'][player]
+    for stat in set(keys['stats']) - set(selected_stats):
+        for player in set(keys['players']) & set(selected_players):
+            del patch['players'][player][stat]
+
+    added_stats = [stat for stat in selected_stats if stat not in keys['stats']]
+    for player in selected_players:
+        if player not in keys['players']:
+            patch['players'][player] = player_series(player_index, rolling_stats, player, selected_stats, lookback)
+        else:
+            for stat, values in player_series(player_index, rolling_stats, player, added_stats, lookback).items():
+                if stat != 'GW':
+                    patch['players'][player][stat] = values
+    return patch, new_keys
+
+app.clientside_callback(
+    ClientsideFunction(namespace='fpl', function_name='renderGraphs'),
+    Output('graphs-gl-container', 'children'),
+    [Input('graph-series-store', 'data'),
+     Input('num-cols-input', 'value')],
+    [State('player-dropdown', 'value'),
+     State('stat-dropdown', 'value')]
+)
+
+# Matches returned for each search of player-dropdown
+PLAYER_OPTIONS_LIMIT = 50
+
+
+@lru_cache(maxsize=8)
+def player_names(season, version):
+    names = np.array(sorted(get_player_index(get_dataset(season)).slices), dtype=str)
+    return names, np.char.lower(names)
+
+
+@app.callback(
+    Output('player-dropdown', 'options'),
+    [Input('player-dropdown', 'search_value'),
+     Input('player-dropdown', 'value')],
+    [State('season-select', 'value')]
+)
+def update_player_options(search_value, selected_players, season=None):
+    # Only the current selection plus the first matches for what's been
+    # typed go to the browser, not every name in the season
+    if not isinstance(selected_players, list):
+        selected_players = [selected_players] if selected_players else []
+    names, lowered = player_names(season, get_dataset(season).version)
+    if search_value:
+        names = names[np.char.find(lowered, search_value.lower()) >= 0]
+    matches = [name for name in names[:PLAYER_OPTIONS_LIMIT + len(selected_players)].tolist()
+               if name not in selected_players][:PLAYER_OPTIONS_LIMIT]
+    return [{'label': name, 'value': name} for name in selected_players + matches]
+
+
+@app.callback(
+    Output('similar-table', 'data'),
+    [Input('player-dropdown', 'value'),
+     Input('similar-price-band', 'value'),
+     Input('similar-same-position', 'value')],
+    [State('season-select', 'value')]
+)
+def update_similar_players(selected_players, price_band, same_position, season=None):
+    if not isinstance(selected_players, list):
+        selected_players = [selected_players]
+    selected_players = [p for p in selected_players if p]
+    index = get_similarity_index(get_dataset(season))
+    if not selected_players or selected_players[0] not in index:
+        return []
+
+    player = selected_players[0]
+    value = index.value[index.players.get_loc(player)]
+    value_range = (value - price_band, value + price_band) if price_band is not None else None
+    positions = None if 'ON' in (same_position or []) else ['GK', 'DEF', 'MID', 'FWD']
+    similar = index.similar(player, k=10, positions=positions, value_range=value_range)
+    # The player's current picks stay out of the suggestions
+    similar = similar[~similar['name'].isin(selected_players)]
+    return similar.assign(distance=similar['distance'].round(3)).to_dict('records')
+
+
+@app.callback(
+    Output('player-dropdown', 'value'),
+    [Input('similar-add-button', 'n_clicks')],
+    [State('similar-table', 'data'),
+     State('player-dropdown', 'value')]
+)
+def add_similar_players(n_clicks, similar, selected_players):
+    if not n_clicks or not similar:
+        raise PreventUpdate
+    if not isinstance(selected_players, list):
+        selected_players = [selected_players] if selected_players else []
+    return selected_players + [row['name'] for row in similar if row['name'] not in selected_players]
+
 @app.callback(
 Output('configurable-table', 'columns'),
 [Input('column-select', 'value')]
@@ -121,125 +293,141 @@ def update_table_columns(selected_columns):
     columns = [{'name': col, 'id': col} for col in selected_columns]
     return columns
 
+# Aggregated tables shared by every session, bounded by FPL_TABLE_CACHE_BYTES
+table_cache = ResultCache(int(os.environ.get('FPL_TABLE_CACHE_BYTES', 64 * 1024 * 1024)))
+
+
+def table_frame(selected_columns, value_range, GW_range, selected_positions, sort_by, sort_order, season=None):
+    # Aggregated table before paging. Slider values arrive as ints or floats
+    # and positions in click order, so normalise them before keying the cache.
+    # Versions are unique across seasons, so they stand in for the season.
+    data = get_dataset(season)
+    version, df = data.current()
+    key = (version, tuple(selected_columns), tuple(float(v) for v in value_range),
+           tuple(int(gw) for gw in GW_range), tuple(sorted(set(selected_positions or ()))), sort_by, sort_order)
+    return table_cache.get_or_compute(key, lambda: aggregate_table(
+        df, list(selected_columns), value_range, GW_range, list(selected_positions or ()),
+        sort_by, sort_order, cumulative=get_cumulative_stats(data)))
+
+
 @app.callback(
-    Output('configurable-table', 'data'),
+    [Output('configurable-table', 'data'),
+     Output('configurable-table', 'page_count'),
+     Output('configurable-table', 'page_current')],
     [Input('column-select', 'value'),
      Input('value-range-slider', 'value'),
      Input('GW-range-slider', 'value'),
      Input('position-filter', 'value'),
      Input('sort-by-select', 'value'),
-     Input('sort-order', 'value')]
+     Input('sort-order', 'value'),
+     Input('configurable-table', 'page_current'),
+     Input('configurable-table', 'page_size'),
+     Input('configurable-table', 'sort_by'),
+     Input('configurable-table', 'filter_query')],
+    [State('season-select', 'value')]
 )
-def update_table(selected_columns, value_range, GW_range, selected_positions, sort_by, sort_order):
+def update_table(selected_columns, value_range, GW_range, selected_positions, sort_by, sort_order,
+                 page_current=0, page_size=25, table_sort_by=None, filter_query='', season=None):
     # Check if any essential input is missing
     if not selected_columns or not sort_by:
         raise PreventUpdate
+    if not isinstance(selected_columns, list):
+        selected_columns = [selected_columns]
 
-    # Filter the DataFrame based on the value range and position
-    filtered_df = df[df['value'].between(value_range[0], value_range[1])]
-    filtered_df = filtered_df[filtered_df['GW'].between(GW_range[0], GW_range[1])]
-    if selected_positions:
-        filtered_df = filtered_df[filtered_df['position'].isin(selected_positions)]
-
-    # Sort the DataFrame by Game Week (GW) first to get the most recent values
-    filtered_df = filtered_df.sort_values(by='GW', ascending=False)
-
-    # Columns to take the most recent value
-    recent_value_cols = ['name', 'team', 'value', 'position']
-    recent_values = filtered_df.groupby('name')[recent_value_cols].first()
+    final_df = table_frame(selected_columns, value_range, GW_range, selected_positions, sort_by, sort_order, season)
 
-    # Other columns to sum
-    sum_columns = [col for col in selected_columns if col not in recent_value_cols]
-    summed_values = filtered_df.groupby('name')[sum_columns].sum()
+    # Column header sorting overrides the sort dropdown
+    page_df, page_count, page_current = get_table_page(final_df, filter_query, table_sort_by,
+                                                       page_current or 0, page_size or 25)
+    return page_df.to_dict('records'), page_count, page_current
 
-    # Combine the two DataFrames
-    final_df = pd.concat([recent_values, summed_values], axis=1)
+# Overview tables, in the order of the callback outputs below
+OVERVIEW_POSITIONS = ['GK', 'DEF', 'MID', 'FWD']
+OVERVIEW_TABLES = [(ranking, position) for ranking in ['points', 'value'] for position in OVERVIEW_POSITIONS]
 
-    # Sort the final DataFrame as per user's choice
-    final_df = final_df.sort_values(by=sort_by, ascending=(sort_order == 'asc'))
 
-    # Ensure only selected columns are included in the final DataFrame
-    final_df = final_df[selected_columns]
+@lru_cache(maxsize=64)
+def overview_records(season, version, num_weeks):
+    # version only keys the cache, a refresh moves on to new entries
+    data = get_dataset(season)
+    tables = get_overview_tables(data.df, num_weeks, OVERVIEW_POSITIONS, cumulative=get_cumulative_stats(data))
+    return tuple(tables[key].to_dict('records') for key in OVERVIEW_TABLES)
 
-    data = final_df.to_dict('records')
-    return data
 
 @app.callback(
-    Output('table-gk-points', 'data'),
-    [Input('overview-weeks-input', 'value')]
+    [Output(f'table-{position.lower()}-{ranking}', 'data') for ranking, position in OVERVIEW_TABLES],
+    [Input('overview-weeks-input', 'value')],
+    [State('season-select', 'value')]
 )
-def update_gk_table(num_weeks):
+def update_overview_tables(num_weeks, season=None):
     if num_weeks is None:
         num_weeks = 1
-    best_performers = get_best_performers_by_points(df, num_weeks, ['GK'])
-    return best_performers.to_dict('records')
+    return list(overview_records(season, get_dataset(season).version, num_weeks))
 
-@app.callback(
-    Output('table-def-points', 'data'),
-    [Input('overview-weeks-input', 'value')]
-)
-def update_gk_table(num_weeks):
-    if num_weeks is None:
-        num_weeks = 1
-    best_performers = get_best_performers_by_points(df, num_weeks, ['DEF'])
-    return best_performers.to_dict('records')
 
-@app.callback(
-    Output('table-mid-points', 'data'),
-    [Input('overview-weeks-input', 'value')]
-)
-def update_gk_table(num_weeks):
-    if num_weeks is None:
-        num_weeks = 1
-    best_performers = get_best_performers_by_points(df, num_weeks, ['MID'])
-    return best_performers.to_dict('records')
+# Movers tables, in the order of the callback outputs below:
+# (table id, column, fallers)
+MOVERS_TABLES = [
+    ('table-price-risers', 'value', False),
+    ('table-price-fallers', 'value', True),
+    ('table-ownership-risers', 'selected', False),
+    ('table-ownership-fallers', 'selected', True),
+]
 
-@app.callback(
-    Output('table-fwd-points', 'data'),
-    [Input('overview-weeks-input', 'value')]
-)
-def update_gk_table(num_weeks):
-    if num_weeks is None:
-        num_weeks = 1
-    best_performers = get_best_performers_by_points(df, num_weeks, ['FWD'])
-    return best_performers.to_dict('records')
 
-@app.callback(
-    Output('table-gk-value', 'data'),
-    [Input('overview-weeks-input', 'value')]
-)
-def update_gk_table(num_weeks):
-    if num_weeks is None:
-        num_weeks = 1
-    best_performers = get_best_performers_by_value(df, num_weeks, ['GK'])
-    return best_performers.to_dict('records')
+@lru_cache(maxsize=64)
+def movers_records(season, version, num_weeks):
+    movers = get_movers(get_dataset(season))
+    latest_gw = movers.max_gw
+    return tuple(
+        movers.top(column, latest_gw - num_weeks, latest_gw, k=50, fallers=fallers)
+              [['name', 'position', 'change']].to_dict('records')
+        for _, column, fallers in MOVERS_TABLES
+    )
 
-@app.callback(
-    Output('table-def-value', 'data'),
-    [Input('overview-weeks-input', 'value')]
-)
-def update_gk_table(num_weeks):
-    if num_weeks is None:
-        num_weeks = 1
-    best_performers = get_best_performers_by_value(df, num_weeks, ['DEF'])
-    return best_performers.to_dict('records')
 
 @app.callback(
-    Output('table-mid-value', 'data'),
-    [Input('overview-weeks-input', 'value')]
+    [Output(table_id, 'data') for table_id, _, _ in MOVERS_TABLES],
+    [Input('overview-weeks-input', 'value')],
+    [State('season-select', 'value')]
 )
-def update_gk_table(num_weeks):
+def update_movers_tables(num_weeks, season=None):
     if num_weeks is None:
         num_weeks = 1
-    best_performers = get_best_performers_by_value(df, num_weeks, ['MID'])
-    return best_performers.to_dict('records')
+    return list(movers_records(season, get_dataset(season).version, num_weeks))
+
+
+@lru_cache(maxsize=64)
+def squad_records(season, version, start_gw, end_gw, objective, budget):
+    # The optimiser is deterministic, so each input is solved once per version
+    pool = player_pool(get_cumulative_stats(get_dataset(season)), start_gw, end_gw, objective)
+    squad = optimise_squad(pool, budget)
+    if squad is None:
+        return None, None
+    records = (squad.assign(role=squad['starting'].map({True: 'XI', False: 'Bench'}),
+                            position=squad['position'].astype(str),
+                            score=squad['score'].round(2))
+                    [['role', 'name', 'position', 'team', 'value', 'score']].to_dict('records'))
+    starting = squad['starting']
+    summary = (f"{OBJECTIVES[objective]}: XI {squad.loc[starting, 'score'].sum():.1f}, "
+               f"bench {squad.loc[~starting, 'score'].sum():.1f}, "
+               f"cost {squad['value'].sum()} of {budget} ({squad.attrs['solver']})")
+    return records, summary
+
 
 @app.callback(
-    Output('table-fwd-value', 'data'),
-    [Input('overview-weeks-input', 'value')]
+    [Output('squad-table', 'data'),
+     Output('squad-summary', 'children')],
+    [Input('squad-objective', 'value'),
+     Input('squad-budget', 'value'),
+     Input('squad-gw-range', 'value')],
+    [State('season-select', 'value')]
 )
-def update_gk_table(num_weeks):
-    if num_weeks is None:
-        num_weeks = 1
-    best_performers = get_best_performers_by_value(df, num_weeks, ['FWD'])
-    return best_performers.to_dict('records')
+def update_squad(objective, budget, GW_range, season=None):
+    if not objective or budget is None or budget < 0 or not GW_range:
+        raise PreventUpdate
+    records, summary = squad_records(season, get_dataset(season).version, int(GW_range[0]), int(GW_range[1]),
+                                     objective, int(budget))
+    if records is None:
+        return [], 'No valid squad fits this budget'
+    return records, summary
@@ -1,89 +1,348 @@
-import requests
+import io
+import logging
+import os
+import numpy as np
 import pandas as pd
-from io import StringIO
+from pandas.api.types import union_categoricals
+from fetch import HashingStream, open_stream
+from movers import Movers
+from snapshot_store import load_snapshot, save_snapshot
 
-def fetch_data(url):
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.content
-    else:
-        raise Exception("Failed to fetch data")
+logger = logging.getLogger(__name__)
 
-def process_data(raw_data):
-    # Convert bytes to a string buffer
-    string_data = StringIO(raw_data.decode('utf-8'))
-    data = pd.read_csv(string_data)
-    # Process the data as required
+# Low-cardinality columns, stored as categoricals
+CATEGORICAL_COLUMNS = ['name', 'team', 'position', 'opponent_team']
+
+# Columns nothing in the app reads. 'round' duplicates 'GW'.
+DROPPED_COLUMNS = ['kickoff_time', 'round']
+
+# Stats stored with decimals, read as floats in every chunk even when a chunk
+# happens to hold only whole numbers
+FLOAT_COLUMNS = ['xP', 'creativity', 'ict_index', 'influence', 'threat', 'expected_assists',
+                 'expected_goal_involvements', 'expected_goals', 'expected_goals_conceded']
+
+# Columns the app can't work without
+REQUIRED_COLUMNS = ['name', 'team', 'position', 'GW', 'value', 'total_points']
+
+# Rows parsed at a time, bounding the uncompacted data held during a load
+CSV_CHUNK_ROWS = int(os.environ.get('FPL_CSV_CHUNK_ROWS', '50000'))
+
+def compact_frame(df):
+    # Replace the read_csv defaults with a compact schema: unused columns dropped,
+    # categoricals for repeated labels and the narrowest lossless numeric dtypes
+    df = df.drop(columns=[col for col in DROPPED_COLUMNS if col in df.columns])
+
+    for col in df.columns:
+        series = df[col]
+        if col in CATEGORICAL_COLUMNS:
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                df[col] = series.astype('category')
+        elif pd.api.types.is_integer_dtype(series.dtype):
+            df[col] = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(series.dtype) and series.dtype != np.float32:
+            # Only when every value survives the round trip exactly
+            narrowed = series.astype(np.float32)
+            if narrowed.astype(series.dtype).equals(series):
+                df[col] = narrowed
+    return df
+
+def concat_frames(frames):
+    # Give each categorical column the same categories in every frame first,
+    # otherwise concat falls back to object
+    frames = [frame.copy(deep=False) for frame in frames]
+    for col in frames[0].columns:
+        if any(isinstance(frame[col].dtype, pd.CategoricalDtype) for frame in frames):
+            columns = [frame[col].astype('category') for frame in frames]
+            categories = union_categoricals(columns, sort_categories=True).categories
+            for frame, column in zip(frames, columns):
+                frame[col] = column.cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+def read_season_csv(stream):
+    # Parse a binary file-like object chunk by chunk, compacting each chunk
+    # before the next is read, so peak memory stays near the final frame size
+    chunks = []
+    raw_bytes = 0
+    reader = pd.read_csv(
+        stream,
+        dtype={**{col: 'category' for col in ['name', 'team', 'position']},
+               **{col: 'float64' for col in FLOAT_COLUMNS}},
+        usecols=lambda col: col not in DROPPED_COLUMNS,
+        encoding='utf-8',
+        chunksize=CSV_CHUNK_ROWS
+    )
+    with reader:
+        for chunk in reader:
+            missing = [col for col in REQUIRED_COLUMNS if col not in chunk.columns]
+            if missing:
+                raise ValueError(f'Season CSV is missing columns {missing}')
+            # Rows without a player or gameweek can't be placed anywhere
+            chunk = chunk.dropna(subset=['name', 'GW'])
+            raw_bytes += chunk.memory_usage(deep=True).sum()
+            chunks.append(compact_frame(chunk))
+
+    # Chunks narrowed to different widths concat to the widest of them
+    data = concat_frames(chunks) if len(chunks) > 1 else chunks[0]
+    logger.info('Season frame %d rows in %d chunks: %.1f MiB parsed -> %.1f MiB stored', len(data), len(chunks),
+                raw_bytes / 2**20, data.memory_usage(deep=True).sum() / 2**20)
     return data
 
-def get_processed_data(url):
-    raw_data = fetch_data(url)
-    processed_data = process_data(raw_data)
-    return processed_data
+def process_data(raw_data):
+    return read_season_csv(io.BytesIO(raw_data))
 
-def get_best_performers_by_points(df, num_weeks, positions):
-    latest_gw = df['GW'].max()
-    filtered_df = df[df['GW'] > latest_gw - num_weeks]
+def append_rows(df, new_rows):
+    return concat_frames([df, new_rows])
 
-    filtered_df = filtered_df.sort_values(by='GW', ascending=False)
+def _row_hashes(df):
+    # Per-row hashes that don't depend on how each frame's columns happened
+    # to be compacted (int8 vs int16, differing category sets)
+    canonical = pd.DataFrame({
+        col: df[col].astype('float64') if pd.api.types.is_numeric_dtype(df[col]) else df[col].astype(str)
+        for col in df.columns
+    })
+    return pd.util.hash_pandas_object(canonical, index=False).to_numpy()
 
-    # Assuming 'value' column represents the current value of the player
-    # Group by player name, sum the total_points, and get the latest 'value'
-    best_performers = (filtered_df.groupby(['name', 'position'])
-                                   .agg(total_points=('total_points', 'sum'),
-                                        value=('value', 'last'))
-                                   .reset_index())
+def first_changed_gw(old_df, new_df):
+    # Earliest GW whose rows differ between two versions of a season, or
+    # None when every row matches. A changed set of columns changes them all.
+    old_gws, new_gws = old_df['GW'].to_numpy(), new_df['GW'].to_numpy()
+    if sorted(old_df.columns) != sorted(new_df.columns):
+        return int(min(old_gws.min(), new_gws.min()))
+    old_hashes, new_hashes = _row_hashes(old_df), _row_hashes(new_df[list(old_df.columns)])
+    for gw in sorted(set(old_gws.tolist()) | set(new_gws.tolist())):
+        if not np.array_equal(old_hashes[old_gws == gw], new_hashes[new_gws == gw]):
+            return int(gw)
+    return None
 
-    # Filter by position if necessary
-    best_performers = best_performers.sort_values(by=['position', 'total_points'], ascending=[True, False])
-    return best_performers[best_performers['position'].isin(positions)].head(50)
+def get_processed_data(url, use_snapshot=True):
+    # Serve from the local snapshot when there is one so startup needs no network
+    if use_snapshot:
+        snapshot = load_snapshot(url)
+        if snapshot is not None:
+            return compact_frame(snapshot)
 
+    # Stream the body into the parser, hashing it on the way for the snapshot.
+    # Sources can also be local copies of the CSV.
+    if os.path.isfile(url):
+        with open(url, 'rb') as f:
+            stream = HashingStream(f)
+            processed_data = read_season_csv(io.BufferedReader(stream))
+        headers = {}
+    else:
+        response, stream = open_stream(url)
+        with response:
+            processed_data = read_season_csv(io.BufferedReader(stream))
+        headers = response.headers
+    if use_snapshot:
+        save_snapshot(url, processed_data, stream.sha256.hexdigest(),
+                      etag=headers.get('ETag'),
+                      last_modified=headers.get('Last-Modified'))
+    return processed_data
+
+def aggregate_recent_points(df, num_weeks, cumulative=None):
+    latest_gw = int(df['GW'].max())
+    if cumulative is not None:
+        # Window sums straight from the cumulative cube, with each player's
+        # latest position and value in the window
+        aggregated_df = cumulative.window_frame(latest_gw - num_weeks + 1, latest_gw,
+                                                ['total_points'], ['position', 'value'])
+        return (aggregated_df.rename_axis('name').reset_index()
+                             [['name', 'position', 'total_points', 'value']])
 
-def get_best_performers_by_value(df, num_weeks, positions):
-    latest_gw = df['GW'].max()
     filtered_df = df[df['GW'] > latest_gw - num_weeks]
 
-    filtered_df = filtered_df.sort_values(by='GW', ascending=False)
+    filtered_df = filtered_df.sort_values(by='GW', kind='stable')
+
+    # Group by player name, sum the total_points, and take the latest
+    # position and value, the same rows the cube picks
+    return (filtered_df.groupby('name', observed=True)
+                       .agg(position=('position', 'last'),
+                            total_points=('total_points', 'sum'),
+                            value=('value', 'last'))
+                       .reset_index())
+
 
-    # Group by player name and position, sum the total_points, and get the latest 'value'
-    aggregated_df = (filtered_df.groupby(['name', 'position'])
-                                 .agg(total_points=('total_points', 'sum'),
-                                      value=('value', 'last'))
-                                 .reset_index())
+def rank_by_points(aggregated_df, positions):
+    # Filter by position if necessary
+    best_performers = aggregated_df.sort_values(by=['position', 'total_points'], ascending=[True, False])
+    return best_performers[best_performers['position'].isin(positions)].head(50)
 
+
+def rank_by_value(aggregated_df, positions):
     # Calculate points per value (total points divided by current value)
+    aggregated_df = aggregated_df.copy()
     aggregated_df['points_value'] = aggregated_df['total_points'] / aggregated_df['value']
     aggregated_df['points_value'] = aggregated_df['points_value'].round(1)
 
     # Filter by position if necessary and sort by points per value
     best_value_performers = aggregated_df[aggregated_df['position'].isin(positions)]
     best_value_performers = best_value_performers.sort_values(by='points_value', ascending=False)
-    
+
     return best_value_performers.head(50)
 
 
+def get_best_performers_by_points(df, num_weeks, positions, cumulative=None):
+    return rank_by_points(aggregate_recent_points(df, num_weeks, cumulative), positions)
+
+
+def get_best_performers_by_value(df, num_weeks, positions, cumulative=None):
+    return rank_by_value(aggregate_recent_points(df, num_weeks, cumulative), positions)
+
 
-def get_largest_price_changes(df, num_weeks):
-    latest_gw = df['GW'].max()
-    start_gw = latest_gw - num_weeks
+def get_overview_tables(df, num_weeks, positions, cumulative=None):
+    # Aggregate once and rank per position both ways, keyed by (ranking, position)
+    aggregated_df = aggregate_recent_points(df, num_weeks, cumulative)
+    tables = {}
+    for position in positions:
+        tables['points', position] = rank_by_points(aggregated_df, [position])
+        tables['value', position] = rank_by_value(aggregated_df, [position])
+    return tables
 
-    # Compare values between start and latest GW
-    start_values = df[df['GW'] == start_gw].set_index('name')['value']
-    latest_values = df[df['GW'] == latest_gw].set_index('name')['value']
 
-    price_changes = (latest_values - start_values).dropna().reset_index()
+# Columns the table shows as their most recent value rather than a sum
+RECENT_VALUE_COLUMNS = ['name', 'team', 'value', 'position']
+
+
+def get_table_columns(df):
+    # Labels like opponent_team can't be summed, so only the per-player ones are offered
+    return [col for col in df.columns
+            if col in RECENT_VALUE_COLUMNS or not isinstance(df[col].dtype, pd.CategoricalDtype)]
+
+
+def aggregate_table(df, selected_columns, value_range, GW_range, selected_positions, sort_by, sort_order,
+                    cumulative=None):
+    # Other columns to sum
+    sum_columns = [col for col in selected_columns if col not in RECENT_VALUE_COLUMNS]
+    if sort_by not in RECENT_VALUE_COLUMNS and sort_by not in sum_columns:
+        sum_columns.append(sort_by)
+
+    # The cube can't filter individual rows by value, so it only serves the
+    # full value range
+    full_value_range = value_range[0] <= df['value'].min() and value_range[1] >= df['value'].max()
+    if cumulative is not None and full_value_range and cumulative.has_stats(sum_columns):
+        final_df = cumulative.window_frame(GW_range[0], GW_range[1], sum_columns, RECENT_VALUE_COLUMNS)
+        if selected_positions:
+            final_df = final_df[final_df['position'].isin(selected_positions)]
+    else:
+        # Filter the DataFrame based on the value range and position
+        filtered_df = df[df['value'].between(value_range[0], value_range[1])]
+        filtered_df = filtered_df[filtered_df['GW'].between(GW_range[0], GW_range[1])]
+        if selected_positions:
+            filtered_df = filtered_df[filtered_df['position'].isin(selected_positions)]
+
+        # Sort the DataFrame by Game Week (GW) first to get the most recent values
+        filtered_df = filtered_df.sort_values(by='GW', ascending=False)
+
+        # Columns to take the most recent value
+        recent_values = filtered_df.groupby('name', observed=True)[RECENT_VALUE_COLUMNS].first()
+        summed_values = filtered_df.groupby('name', observed=True)[sum_columns].sum()
+
+        # Combine the two DataFrames
+        final_df = pd.concat([recent_values, summed_values], axis=1)
+        final_df.index.name = None
+
+    # Sort the final DataFrame as per user's choice
+    final_df = final_df.sort_values(by=sort_by, ascending=(sort_order == 'asc'))
+
+    # Ensure only selected columns are included in the final DataFrame
+    return final_df[selected_columns]
+
+
+# DataTable filter operators, longest prefixes first
+FILTER_OPERATORS = [['ge ', '>='], ['le ', '<='], ['lt ', '<'], ['gt ', '>'], ['ne ', '!='], ['eq ', '='],
+                    ['contains '], ['datestartswith ']]
+
+def split_filter_part(filter_part):
+    # Parse one '{column} op value' clause of a DataTable filter_query
+    for operator_type in FILTER_OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+
+                value_part = value_part.strip()
+                v0 = value_part[0] if value_part else ''
+                if v0 == value_part[-1:] and v0 in ("'", '"', '`'):
+                    value = value_part[1: -1].replace('\\' + v0, v0)
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+
+                return name, operator_type[0].strip(), value
+
+    return None, None, None
+
+
+def apply_filter_query(df, filter_query):
+    for filter_part in (filter_query or '').split(' && '):
+        col_name, operator, filter_value = split_filter_part(filter_part)
+        if col_name not in df.columns:
+            continue
+
+        column = df[col_name]
+        # Numbers parse as floats, text operators match them as written
+        text = filter_value if isinstance(filter_value, str) else f'{filter_value:g}'
+        if operator in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+            # Clauses whose value doesn't fit the column are ignored rather
+            # than raising, text columns can only be matched exactly
+            if pd.api.types.is_numeric_dtype(column):
+                try:
+                    filter_value = float(filter_value)
+                except ValueError:
+                    continue
+            elif operator in ('eq', 'ne'):
+                filter_value = text
+            else:
+                continue
+            # These operators match pandas series operator method names
+            df = df.loc[getattr(column, operator)(filter_value)]
+        elif operator == 'contains':
+            df = df.loc[column.astype(str).str.contains(text, regex=False)]
+        elif operator == 'datestartswith':
+            df = df.loc[column.astype(str).str.startswith(text)]
+    return df
+
+
+def get_table_page(final_df, filter_query, sort_by, page_current, page_size):
+    # Filter, sort and slice an aggregated table down to one DataTable page.
+    # Returns (page, page_count, page_current).
+    final_df = apply_filter_query(final_df, filter_query)
+    # Header sorts on columns that have since been deselected are ignored
+    sort_by = [col for col in sort_by or [] if col['column_id'] in final_df.columns]
+    if sort_by:
+        final_df = final_df.sort_values(
+            [col['column_id'] for col in sort_by],
+            ascending=[col['direction'] == 'asc' for col in sort_by],
+            inplace=False
+        )
+
+    # Narrower filters can leave fewer pages than the one being viewed
+    page_count = max(1, -(-len(final_df) // page_size))
+    page_current = min(page_current, page_count - 1)
+    start = page_current * page_size
+    return final_df.iloc[start:start + page_size], page_count, page_current
+
+
+def get_largest_price_changes(df, num_weeks, movers=None):
+    if movers is None:
+        movers = Movers(df)
+    latest_gw = movers.max_gw
+
+    # Compare values between start and latest GW, from each player's first
+    # and last appearance in that range
+    price_changes = movers.changes('value', latest_gw - num_weeks, latest_gw)[['name', 'change']]
     price_changes.columns = ['name', 'price_change']
     return price_changes.sort_values(by='price_change', ascending=False)
 
 
-def get_largest_ownership_changes(df, num_weeks):
-    latest_gw = df['GW'].max()
-    start_gw = latest_gw - num_weeks
+def get_largest_ownership_changes(df, num_weeks, movers=None):
+    if movers is None:
+        movers = Movers(df)
+    latest_gw = movers.max_gw
 
     # Compare ownership between start and latest GW
-    start_ownership = df[df['GW'] == start_gw].set_index('name')['selected']
-    latest_ownership = df[df['GW'] == latest_gw].set_index('name')['selected']
-
-    ownership_changes = (latest_ownership - start_ownership).dropna().reset_index()
+    ownership_changes = movers.changes('selected', latest_gw - num_weeks, latest_gw)[['name', 'change']]
     ownership_changes.columns = ['name', 'ownership_change']
     return ownership_changes.sort_values(by='ownership_change', ascending=False)
@@ -0,0 +1,261 @@
+import io
+import itertools
+import logging
+import os
+import threading
+import time
+
+from data_handler import append_rows, first_changed_gw, get_processed_data, read_season_csv
+from fetch import HashingStream, fetch_response
+from snapshot_store import read_manifest, save_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Seconds between background refreshes, 0 disables the refresher
+REFRESH_INTERVAL = int(os.environ.get('FPL_REFRESH_INTERVAL', '900'))
+
+# Directory for a dataset shared by all worker processes, ideally on tmpfs
+# such as /dev/shm/fpl. Unset keeps a private copy in every worker.
+SHARED_DIR = os.environ.get('FPL_SHARED_DIR')
+
+# Versions are unique across every Dataset so they can key shared caches
+_versions = itertools.count(1)
+
+
+class Dataset:
+    def __init__(self, url, shared_dir=SHARED_DIR):
+        self.url = url
+        self.etag = None
+        self.last_modified = None
+        self.content_hash = None
+        # (version, DataFrame), replaced as a whole so readers never see a
+        # half-updated pair
+        self._state = (0, None)
+        # _lock guards loading and swapping, _refresh_lock keeps refreshes
+        # one at a time without blocking readers while one downloads
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refresher = None
+        self._derived = {}
+        # {version: row count} of earlier frames the current one extends,
+        # so derived structures can be updated from the new rows alone
+        self._prefixes = {}
+        # Called with no arguments after every load or refresh that swaps in
+        # a new frame, outside the lock
+        self._listeners = []
+
+        self.shared = None
+        self._shared_version = None
+        if shared_dir:
+            # pyarrow is only needed in shared mode
+            from shared_dataset import SharedStore
+            self.shared = SharedStore(shared_dir, url)
+
+    def current(self):
+        return self._state
+
+    @property
+    def df(self):
+        return self._state[1]
+
+    @property
+    def version(self):
+        return self._state[0]
+
+    def fingerprint(self):
+        # Names the current contents the same way in every worker process,
+        # unlike version which is only unique within one. The shared version
+        # restarts at 1 when the shared directory is recreated, so it is only
+        # a fallback for frames without a content hash.
+        if self.content_hash:
+            return self.content_hash
+        if self.shared is not None:
+            return f'shared-{self._shared_version}'
+        return f'local-{self.version}'
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _notify(self):
+        for listener in list(self._listeners):
+            try:
+                listener()
+            except Exception:
+                logger.exception('Listener failed for %s', self.url)
+
+    def load(self):
+        # Called on every lookup, so the loaded case takes no lock
+        if self._state[1] is not None:
+            return self._state[1]
+
+        swapped = False
+        with self._lock:
+            if self._state[1] is None:
+                if self.shared is not None:
+                    # The first worker in builds and publishes, the rest attach
+                    with self.shared.lock():
+                        if self.shared.published_version() is None:
+                            self.shared.publish(self._load_local(), source=self._source())
+                    pointer, df = self.shared.attach()
+                    self._attached(pointer)
+                else:
+                    df = self._load_local()
+                self._swap(df)
+                swapped = True
+        if swapped:
+            self._notify()
+        return self.df
+
+    def _load_local(self):
+        df = get_processed_data(self.url)
+        self._set_source(read_manifest(self.url) or {})
+        return df
+
+    def _source(self):
+        return {'etag': self.etag, 'last_modified': self.last_modified, 'content_hash': self.content_hash}
+
+    def _set_source(self, source):
+        self.etag = source.get('etag')
+        self.last_modified = source.get('last_modified')
+        self.content_hash = source.get('content_hash')
+
+    def _attached(self, pointer):
+        # Take the upstream details from whichever worker published
+        self._shared_version = pointer['version']
+        self._set_source(pointer.get('source') or {})
+
+    def derived(self, name, build, update=None):
+        # Structures built from the frame, rebuilt lazily after each swap.
+        # With update, one built for an earlier frame that the current one
+        # extends is passed the appended rows instead of rebuilding.
+        version, df = self._state
+        cached = self._derived.get(name)
+        if cached is None or cached[0] != version:
+            if update is not None and cached is not None and cached[0] in self._prefixes:
+                cached = (version, update(cached[1], df.iloc[self._prefixes[cached[0]]:]))
+            else:
+                cached = (version, build(df))
+            self._derived[name] = cached
+        return cached[1]
+
+    def _swap(self, df, appended=False):
+        # appended: df is the current frame with rows added at the end
+        version, old_df = self._state
+        if appended and old_df is not None:
+            self._prefixes[version] = len(old_df)
+        else:
+            self._prefixes = {}
+        self._state = (next(_versions), df)
+
+    def _fetch_update(self):
+        # (frame, appended, source) when upstream changed, or None when it
+        # didn't. appended means the new frame is the current one plus rows at
+        # the end. source has the new validators, which the caller takes once
+        # the frame is in use, otherwise a refresh that failed on the way
+        # would be answered with 304s from then on.
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+
+        # Conditional request, so an unchanged file costs a 304 and no parse
+        response = fetch_response(self.url, headers=headers, stream=True)
+        with response:
+            if response.status_code == 304:
+                return None
+            response.raw.decode_content = True
+            stream = HashingStream(response.raw)
+            new_df = read_season_csv(io.BufferedReader(stream))
+
+        source = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'content_hash': stream.sha256.hexdigest(),
+        }
+        if source['content_hash'] == self.content_hash:
+            self._set_source(source)
+            return None
+
+        # Upstream adds rows to the latest GW as fixtures finish and corrects
+        # earlier ones, so everything from the first changed GW is re-taken
+        df = self.df
+        changed_gw = first_changed_gw(df, new_df)
+        result = None
+        if changed_gw is not None:
+            kept = (df['GW'] < changed_gw).to_numpy()
+            if kept.all():
+                result = (append_rows(df, new_df[new_df['GW'] >= changed_gw]), True)
+            else:
+                result = (new_df, False)
+            logger.info('Updated GW %d onwards from %s', changed_gw, self.url)
+
+        # The manifest follows the digest even when no row changed, so a
+        # restart doesn't refetch or reload something older
+        self._save_snapshot(result[0] if result else df, source)
+        if result is None:
+            self._set_source(source)
+            return None
+        return result + (source,)
+
+    def _save_snapshot(self, df, source):
+        # The snapshot only spares a restart the download, so failing to
+        # write it doesn't hold up the refresh
+        try:
+            save_snapshot(self.url, df, source['content_hash'],
+                          etag=source['etag'], last_modified=source['last_modified'])
+        except Exception:
+            logger.exception('Failed to save a snapshot of %s', self.url)
+
+    def refresh(self):
+        if self.shared is not None:
+            return self._refresh_shared()
+
+        with self._refresh_lock:
+            update = self._fetch_update()
+            if update is None:
+                return False
+            df, appended, source = update
+            with self._lock:
+                self._swap(df, appended=appended)
+                self._set_source(source)
+        self._notify()
+        return True
+
+    def _refresh_shared(self):
+        # Whichever worker gets the lock checks upstream and publishes, the
+        # others only notice the new version and re-attach
+        with self._refresh_lock:
+            with self.shared.lock(blocking=False) as owner:
+                if owner and self.shared.published_version() == self._shared_version:
+                    update = self._fetch_update()
+                    if update is not None:
+                        df, appended, source = update
+                        self.shared.publish(df, extends=len(self.df) if appended else None, source=source)
+
+            if self.shared.published_version() == self._shared_version:
+                return False
+            pointer, df = self.shared.attach()
+            extends = pointer.get('extends')
+            with self._lock:
+                # Only an append when the frame we hold is the one that was extended
+                self._swap(df, appended=extends is not None and extends[0] == self._shared_version)
+                self._attached(pointer)
+        self._notify()
+        return True
+
+    def start_refresher(self, interval=REFRESH_INTERVAL):
+        if interval <= 0 or self._refresher is not None:
+            return
+
+        def run():
+            # Check straight away, a snapshot served at startup may be stale
+            while True:
+                try:
+                    self.refresh()
+                except Exception:
+                    logger.exception('Failed to refresh %s', self.url)
+                time.sleep(interval)
+
+        self._refresher = threading.Thread(target=run, name='dataset-refresher', daemon=True)
+        self._refresher.start()
@@ -0,0 +1,231 @@
+import hashlib
+import io
+import zlib
+
+from flask import Response, abort, request
+
+from aggregates import get_cumulative_stats
+from callbacks import table_frame
+from data_handler import (apply_filter_query, get_best_performers_by_points, get_best_performers_by_value,
+                          get_table_columns)
+from movers import get_movers
+from seasons import get_dataset
+
+# Rows serialised per chunk of a streamed response
+EXPORT_CHUNK_ROWS = 10000
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+COMPRESSIONS = ['none', 'gzip', 'zstd']
+POSITIONS = ['GK', 'DEF', 'MID', 'FWD']
+
+
+def _list_arg(name, default):
+    value = request.args.get(name)
+    return [item for item in value.split(',') if item] if value else default
+
+
+def _int_arg(name, default):
+    try:
+        return int(request.args.get(name, default))
+    except ValueError:
+        abort(400, f'{name} must be an integer')
+
+
+def _dataset():
+    try:
+        return get_dataset(request.args.get('season'))
+    except KeyError:
+        abort(404, 'Unknown season')
+
+
+def _compression():
+    # Explicit ?compression= wins, otherwise gzip for clients that accept it
+    compression = request.args.get('compression')
+    if compression is None:
+        compression = 'gzip' if 'gzip' in request.headers.get('Accept-Encoding', '') else 'none'
+    if compression not in COMPRESSIONS:
+        abort(400, f'compression must be one of {", ".join(COMPRESSIONS)}')
+    return compression
+
+
+class _Sink(io.RawIOBase):
+    # Write-only file that hands back whatever was written since the last
+    # drain, so pyarrow writers can be streamed out piece by piece
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _csv_chunks(df):
+    for start in range(0, max(len(df), 1), EXPORT_CHUNK_ROWS):
+        yield df.iloc[start:start + EXPORT_CHUNK_ROWS].to_csv(index=False, header=start == 0).encode('utf-8')
+
+
+def _arrow_chunks(df, fmt, compression):
+    # pyarrow is optional, only these two formats need it
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    sink = _Sink()
+    if fmt == 'parquet':
+        # Parquet compresses its own pages
+        writer = pq.ParquetWriter(sink, schema, compression=compression)
+    else:
+        # Arrow IPC can compress buffers with zstd, gzip goes on the response
+        options = pa.ipc.IpcWriteOptions(compression='zstd' if compression == 'zstd' else None)
+        writer = pa.ipc.new_stream(sink, schema, options=options)
+    with writer:
+        for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+            writer.write_table(pa.Table.from_pandas(df.iloc[start:start + EXPORT_CHUNK_ROWS], schema=schema,
+                                                    preserve_index=False))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _encoded(chunks, compression):
+    if compression == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            yield compressor.compress(chunk)
+        yield compressor.flush()
+    elif compression == 'zstd':
+        import zstandard
+        compressor = zstandard.ZstdCompressor().compressobj()
+        for chunk in chunks:
+            yield compressor.compress(chunk)
+        yield compressor.flush()
+    else:
+        yield from chunks
+
+
+def _respond(name, data, build):
+    # ETag from the data's contents and the normalised request, so every
+    # worker answers a repeat request with 304 until the data changes
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        abort(400, f'format must be one of {", ".join(FORMATS)}')
+    compression = _compression()
+    if compression == 'zstd' and fmt == 'csv':
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            abort(406, 'zstd is not available on this server')
+    if fmt != 'csv':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            abort(406, f'{fmt} needs pyarrow, which is not installed on this server')
+
+    args = sorted((key, value) for key, value in request.args.items(multi=True) if key != 'compression')
+    signature = repr((name, data.fingerprint(), args, compression)).encode('utf-8')
+    etag = hashlib.sha256(signature).hexdigest()[:32]
+    if etag in request.if_none_match:
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
+
+    df = build()
+    if fmt == 'csv':
+        chunks, content_encoding = _csv_chunks(df), compression
+    else:
+        chunks = _arrow_chunks(df, fmt, compression)
+        content_encoding = 'gzip' if fmt == 'arrow' and compression == 'gzip' else 'none'
+
+    mimetype, extension = FORMATS[fmt]
+    headers = {
+        'ETag': f'"{etag}"',
+        'Cache-Control': 'no-cache',
+        'Vary': 'Accept-Encoding',
+        'Content-Disposition': f'attachment; filename="{name}.{extension}"',
+        'X-Row-Count': str(len(df)),
+    }
+    if content_encoding != 'none':
+        headers['Content-Encoding'] = content_encoding
+    return Response(_encoded(chunks, content_encoding), mimetype=mimetype, headers=headers)
+
+
+def export_table():
+    # The configurable table: same aggregation, cache and filter syntax
+    data = _dataset()
+    df = data.df
+    columns = _list_arg('columns', ['name', 'team', 'value', 'total_points'])
+    # Only the columns the tables tab offers, labels can't be summed
+    table_columns = get_table_columns(df)
+    unknown = [col for col in columns if col not in table_columns]
+    if unknown:
+        abort(400, f'Unknown or unsummable columns: {", ".join(unknown)}')
+    value_range = [_int_arg('value_min', df['value'].min()), _int_arg('value_max', df['value'].max())]
+    GW_range = [_int_arg('gw_start', df['GW'].min()), _int_arg('gw_end', df['GW'].max())]
+    positions = _list_arg('positions', POSITIONS)
+    sort_by = request.args.get('sort_by', 'total_points' if 'total_points' in columns else columns[0])
+    if sort_by not in columns:
+        abort(400, 'sort_by must be one of the exported columns')
+    sort_order = request.args.get('sort_order', 'desc')
+
+    def build():
+        final_df = table_frame(columns, value_range, GW_range, positions, sort_by, sort_order,
+                               request.args.get('season'))
+        return apply_filter_query(final_df, request.args.get('filter', ''))
+
+    return _respond('table', data, build)
+
+
+def export_overview():
+    # Best performers over the last weeks, ranked by points or points per value
+    data = _dataset()
+    ranking = request.args.get('ranking', 'points')
+    if ranking not in ('points', 'value'):
+        abort(400, 'ranking must be points or value')
+    num_weeks = _int_arg('weeks', 4)
+    positions = _list_arg('positions', POSITIONS)
+    rank = get_best_performers_by_points if ranking == 'points' else get_best_performers_by_value
+
+    def build():
+        return rank(data.df, num_weeks, positions, cumulative=get_cumulative_stats(data)).reset_index(drop=True)
+
+    return _respond(f'overview-{ranking}', data, build)
+
+
+def export_movers():
+    # Price, ownership or transfer movers over the last weeks
+    data = _dataset()
+    column = request.args.get('column', 'value')
+    if column not in ('value', 'selected', 'transfers_balance'):
+        abort(400, 'column must be value, selected or transfers_balance')
+    num_weeks = _int_arg('weeks', 4)
+    k = _int_arg('k', 50)
+    if k < 1:
+        abort(400, 'k must be at least 1')
+    fallers = request.args.get('fallers', '0') in ('1', 'true')
+
+    def build():
+        movers = get_movers(data)
+        return movers.top(column, movers.max_gw - num_weeks, movers.max_gw, k=k, fallers=fallers)
+
+    return _respond(f'movers-{column}', data, build)
+
+
+def install(app):
+    app.server.add_url_rule('/export/table', 'export_table', export_table)
+    app.server.add_url_rule('/export/overview', 'export_overview', export_overview)
+    app.server.add_url_rule('/export/movers', 'export_movers', export_movers)
@@ -0,0 +1,87 @@
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (float(os.environ.get('FPL_CONNECT_TIMEOUT', '5')), float(os.environ.get('FPL_READ_TIMEOUT', '60')))
+MAX_RETRIES = int(os.environ.get('FPL_FETCH_RETRIES', '4'))
+# Threads and pooled connections per host for parallel fetches
+MAX_WORKERS = int(os.environ.get('FPL_FETCH_WORKERS', '8'))
+
+
+class FetchError(Exception):
+    def __init__(self, url, status_code=None, reason=None):
+        self.url = url
+        self.status_code = status_code
+        super().__init__(f'Failed to fetch {url}: {status_code or reason}')
+
+
+def _build_session():
+    # Exponential backoff (0.5s, 1s, 2s, ...) on connection errors and the
+    # statuses GitHub returns when it is busy or rate limiting
+    retry = Retry(
+        total=MAX_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+session = _build_session()
+
+
+def fetch_response(url, headers=None, stream=False):
+    try:
+        response = session.get(url, headers=headers, timeout=TIMEOUT, stream=stream)
+    except requests.RequestException as e:
+        raise FetchError(url, reason=e) from e
+    # 304 is a valid answer to a conditional request
+    if response.status_code not in (200, 304):
+        response.close()
+        raise FetchError(url, status_code=response.status_code)
+    return response
+
+
+class HashingStream(io.RawIOBase):
+    # Passes a response body through while hashing it, so the snapshot key
+    # needs no second copy of the bytes
+
+    def __init__(self, raw):
+        self._raw = raw
+        self.sha256 = hashlib.sha256()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self._raw.read(len(buffer))
+        self.sha256.update(chunk)
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def open_stream(url):
+    # Response plus a buffered, hashing reader over its decoded body
+    response = fetch_response(url, stream=True)
+    response.raw.decode_content = True
+    return response, HashingStream(response.raw)
+
+
+def run_parallel(fn, items, max_workers=MAX_WORKERS):
+    # {item: fn(item)}, with the first exception re-raised
+    items = list(items)
+    if not items:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        return dict(zip(items, pool.map(fn, items)))
@@ -1,16 +1,35 @@
 from dash import html, dcc
 from app import app
 import callbacks
+import export
 import layouts
+import startup
+import warmup
+from seasons import DEFAULT_SEASON, registry
 
 app.layout = html.Div([
+    html.Div([
+        html.Label("Season:"),
+        dcc.Dropdown(
+            id='season-select',
+            options=[{'label': season, 'value': season} for season in registry.seasons()],
+            value=DEFAULT_SEASON,
+            clearable=False
+        )
+    ], style={'width': '200px'}),
     dcc.Tabs([
         dcc.Tab(label='Overview', value='tab-overview'),
         dcc.Tab(label='Graphs', value='tab-graphs'),
         dcc.Tab(label='Tables', value='tab-tables'),
+        dcc.Tab(label='Squad', value='tab-squad'),
     ], id='tabs', value='tab-graphs'),
     html.Div(id='tabs-content')
 ])
 
+# Warm-up listens for the loads that startup kicks off
+warmup.install()
+startup.install(app)
+export.install(app)
+
 if __name__ == '__main__':
     app.run_server(debug=True)
@@ -0,0 +1,152 @@
+import cProfile
+import functools
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+
+from flask import Response
+from plotly.io.json import to_json_plotly
+
+logger = logging.getLogger(__name__)
+
+# Everything here is opt-in, FPL_INSTRUMENT=1 turns it on
+ENABLED = os.environ.get('FPL_INSTRUMENT') == '1'
+# Calls slower than this (compute plus serialisation) are logged
+SLOW_CALLBACK_MS = float(os.environ.get('FPL_SLOW_CALLBACK_MS', '500'))
+# Fraction of calls run under cProfile, dumped to PROFILE_DIR when slow
+PROFILE_SAMPLE_RATE = float(os.environ.get('FPL_PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.environ.get('FPL_PROFILE_DIR', 'profiles')
+
+# Upper bounds of the compute time histogram, in seconds
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]
+
+
+class CallbackStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.prevented = 0
+        self.compute_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.payload_bytes = 0
+        self.bucket_counts = [0] * len(BUCKETS)
+
+
+_stats = {}
+_lock = threading.Lock()
+
+
+def input_signature(args):
+    # Short stable hash of the inputs, enough to spot repeated slow calls
+    return hashlib.sha1(repr(args).encode('utf-8')).hexdigest()[:12]
+
+
+def _record(name, compute_seconds, serialize_seconds=0.0, payload_bytes=0, outcome='ok'):
+    with _lock:
+        stats = _stats.setdefault(name, CallbackStats())
+        stats.calls += 1
+        stats.compute_seconds += compute_seconds
+        stats.serialize_seconds += serialize_seconds
+        stats.payload_bytes += payload_bytes
+        if outcome == 'error':
+            stats.errors += 1
+        elif outcome == 'prevented':
+            stats.prevented += 1
+        for i, bound in enumerate(BUCKETS):
+            if compute_seconds <= bound:
+                stats.bucket_counts[i] += 1
+
+
+def timed(func):
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = cProfile.Profile() if random.random() < PROFILE_SAMPLE_RATE else None
+        start = time.perf_counter()
+        try:
+            if profiler is not None:
+                result = profiler.runcall(func, *args, **kwargs)
+            else:
+                result = func(*args, **kwargs)
+        except Exception as e:
+            # PreventUpdate and friends are control flow, not failures
+            outcome = 'prevented' if type(e).__name__ in ('PreventUpdate', 'NoUpdate') else 'error'
+            _record(name, time.perf_counter() - start, outcome=outcome)
+            raise
+        compute_seconds = time.perf_counter() - start
+
+        # Serialise the way Dash will, to see what the response costs
+        start = time.perf_counter()
+        payload_bytes = len(to_json_plotly(result).encode('utf-8'))
+        serialize_seconds = time.perf_counter() - start
+        _record(name, compute_seconds, serialize_seconds, payload_bytes)
+
+        total_ms = (compute_seconds + serialize_seconds) * 1000
+        if total_ms >= SLOW_CALLBACK_MS:
+            signature = input_signature(args)
+            logger.warning('Slow callback %s: %.0f ms compute, %.0f ms serialise, %d bytes, inputs %s',
+                           name, compute_seconds * 1000, serialize_seconds * 1000, payload_bytes, signature)
+            if profiler is not None:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                profiler.dump_stats(os.path.join(PROFILE_DIR, f'{name}-{int(time.time())}-{signature}.prof'))
+        return result
+
+    return wrapper
+
+
+def metrics_text():
+    # Prometheus text exposition format
+    lines = [
+        '# HELP fpl_callback_calls_total Callback invocations.',
+        '# TYPE fpl_callback_calls_total counter',
+    ]
+    with _lock:
+        stats = {name: vars(s).copy() for name, s in _stats.items()}
+
+    for name, s in sorted(stats.items()):
+        lines.append(f'fpl_callback_calls_total{{callback="{name}",outcome="ok"}} '
+                     f'{s["calls"] - s["errors"] - s["prevented"]}')
+        lines.append(f'fpl_callback_calls_total{{callback="{name}",outcome="error"}} {s["errors"]}')
+        lines.append(f'fpl_callback_calls_total{{callback="{name}",outcome="prevented"}} {s["prevented"]}')
+
+    lines += ['# HELP fpl_callback_compute_seconds Time spent inside the callback function.',
+              '# TYPE fpl_callback_compute_seconds histogram']
+    for name, s in sorted(stats.items()):
+        for bound, count in zip(BUCKETS, s['bucket_counts']):
+            lines.append(f'fpl_callback_compute_seconds_bucket{{callback="{name}",le="{bound}"}} {count}')
+        lines.append(f'fpl_callback_compute_seconds_bucket{{callback="{name}",le="+Inf"}} {s["calls"]}')
+        lines.append(f'fpl_callback_compute_seconds_sum{{callback="{name}"}} {s["compute_seconds"]}')
+        lines.append(f'fpl_callback_compute_seconds_count{{callback="{name}"}} {s["calls"]}')
+
+    lines += ['# HELP fpl_callback_serialize_seconds_total Time spent serialising callback responses.',
+              '# TYPE fpl_callback_serialize_seconds_total counter']
+    for name, s in sorted(stats.items()):
+        lines.append(f'fpl_callback_serialize_seconds_total{{callback="{name}"}} {s["serialize_seconds"]}')
+
+    lines += ['# HELP fpl_callback_payload_bytes_total Bytes of serialised callback responses.',
+              '# TYPE fpl_callback_payload_bytes_total counter']
+    for name, s in sorted(stats.items()):
+        lines.append(f'fpl_callback_payload_bytes_total{{callback="{name}"}} {s["payload_bytes"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def install(app):
+    # Wrap every callback registered from here on and expose /metrics
+    if not ENABLED:
+        return
+
+    register = app.callback
+
+    def callback(*args, **kwargs):
+        decorator = register(*args, **kwargs)
+        return lambda func: decorator(timed(func))
+
+    app.callback = callback
+    app.server.add_url_rule(
+        '/metrics', 'metrics',
+        lambda: Response(metrics_text(), mimetype='text/plain; version=0.0.4')
+    )
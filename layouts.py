@@ -1,12 +1,12 @@
+import os
 from dash import html, dcc, dash_table
-import plotly.graph_objs as go
-from data_handler import get_processed_data
+from data_handler import get_table_columns
+from optimiser import OBJECTIVES, SQUAD_BUDGET
+from seasons import get_dataset
 
-# Fetch and process the data
-data_url = 'https://github.com/vaastav/Fantasy-Premier-League/blob/master/data/2023-24/gws/merged_gw.csv?raw=true'
-df = get_processed_data(data_url)
+# Build the graphs grid in the browser from compact series data
+CLIENTSIDE_GRAPHS = os.environ.get('FPL_CLIENTSIDE_GRAPHS') == '1'
 
-unique_players = sorted(df['name'].unique())
 selected_columns = [
     'xP', 'assists', 'bonus', 'bps', 'clean_sheets', 'creativity',
     'goals_conceded', 'goals_scored', 'ict_index', 'influence', 'minutes',
@@ -14,7 +14,11 @@ selected_columns = [
     'value', 'yellow_cards', 'red_cards'
 ]
 
-def graphs_tab():
+# Default selection in player-dropdown, whose other options are searched on
+# the server rather than all sent with the layout
+DEFAULT_PLAYER = 'Erling Haaland'
+
+def graphs_tab(season=None):
     return html.Div([
         html.H1("FPL Player Statistics"),
         html.Div([
@@ -47,8 +51,9 @@ def graphs_tab():
         html.Label("Select Player:"),
         dcc.Dropdown(
             id='player-dropdown',
-            options=[{'label': player, 'value': player} for player in unique_players],
-            value='Erling Haaland',  # default value
+            options=[{'label': DEFAULT_PLAYER, 'value': DEFAULT_PLAYER}],
+            value=DEFAULT_PLAYER,  # default value
+            placeholder='Type to search players',
             multi=True
         ),
 
@@ -60,7 +65,34 @@ def graphs_tab():
             multi=True
         ),
 
-        html.Div(id='graphs-container')
+        # The clientside mode ships raw series once and draws WebGL figures in
+        # the browser, only one of the two containers is ever rendered
+        html.Div(id='graphs-gl-container') if CLIENTSIDE_GRAPHS else html.Div(id='graphs-container'),
+        dcc.Store(id='graph-series-store') if CLIENTSIDE_GRAPHS else None,
+        dcc.Store(id='graph-series-keys') if CLIENTSIDE_GRAPHS else None,
+
+        # Nearest players by per-90 profile to the first selected player
+        html.Div([
+            html.H3("Similar Players"),
+            html.Div([
+                html.Label('Price band (±):'),
+                dcc.Input(id='similar-price-band', type='number', value=10, min=0,
+                          style={'width': '100px', 'margin': '0 10px 0 5px'}),
+                dcc.Checklist(
+                    id='similar-same-position',
+                    options=[{'label': 'Same position only', 'value': 'ON'}],
+                    value=['ON'],
+                    inputStyle={"margin-right": "5px"}
+                ),
+                html.Button('Add to graphs', id='similar-add-button', style={'margin-left': '10px'}),
+            ], style={'display': 'flex', 'align-items': 'center', 'margin-bottom': '10px'}),
+            dash_table.DataTable(
+                id='similar-table',
+                columns=[{'name': col, 'id': col} for col in ['name', 'position', 'team', 'value', 'distance']],
+                style_cell={'textAlign': 'left', 'fontSize': '12px'},
+                style_header={'backgroundColor': 'white', 'fontWeight': 'bold'}
+            )
+        ], style={'margin-top': '20px'}),
     ])
 
 def overview_tab():
@@ -144,15 +176,36 @@ def overview_tab():
             style_header={'backgroundColor': 'white', 'fontWeight': 'bold'}
         )], className='table-container'),
         ], style={'display': 'grid', 'grid-template-columns': 'repeat(auto-fill, minmax(300px, 1fr))', 'grid-gap': '5px'}),
+
+        # Price and ownership movers over the same number of weeks
+        html.Div([
+            html.Div([
+            html.Label(label, style={'font-weight': 'bold'}),
+            dash_table.DataTable(
+            id=table_id,
+            columns=[{'name': col, 'id': col} for col in ['name', 'position', 'change']],
+            style_table={'height': '300px', 'overflowY': 'auto'},
+            style_cell={'textAlign': 'left', 'fontSize': '10px'},
+            style_header={'backgroundColor': 'white', 'fontWeight': 'bold'}
+        )], className='table-container')
+            for label, table_id in [
+                ("Price Risers", 'table-price-risers'),
+                ("Price Fallers", 'table-price-fallers'),
+                ("Ownership Risers", 'table-ownership-risers'),
+                ("Ownership Fallers", 'table-ownership-fallers'),
+            ]
+        ], style={'display': 'grid', 'grid-template-columns': 'repeat(auto-fill, minmax(300px, 1fr))', 'grid-gap': '5px', 'margin-top': '20px'}),
     ])
 
 
-def tables_tab():
+def tables_tab(season=None):
+    df = get_dataset(season).df
+    table_columns = get_table_columns(df)
     return html.Div([
         html.Label("Select Statistic:"),
         dcc.Dropdown(
             id='column-select',
-            options=[{'label': stat, 'value': stat} for stat in df.columns],
+            options=[{'label': stat, 'value': stat} for stat in table_columns],
             value=['name', 'team', 'value', 'total_points'],  # default value
             multi=True
         ),
@@ -195,7 +248,7 @@ def tables_tab():
             html.Label("Sort by:"),
             dcc.Dropdown(
                 id='sort-by-select',
-                options=[{'label': col, 'value': col} for col in df.columns],
+                options=[{'label': col, 'value': col} for col in table_columns],
                 value='total_points',  # Default sort column
                 multi=False
             ),
@@ -206,5 +259,55 @@ def tables_tab():
                 inline=True
             )
         ]),
-        dash_table.DataTable(id='configurable-table')
-    ])
\ No newline at end of file
+        # Paged, sorted and filtered on the server so only the visible page is sent
+        dash_table.DataTable(
+            id='configurable-table',
+            page_action='custom',
+            page_current=0,
+            page_size=25,
+            sort_action='custom',
+            sort_mode='multi',
+            sort_by=[],
+            filter_action='custom',
+            filter_query=''
+        )
+    ])
+
+
+def squad_tab(season=None):
+    df = get_dataset(season).df
+    objectives = [key for key in OBJECTIVES if key != 'xP' or 'xP' in df.columns]
+    return html.Div([
+        html.Div([
+            html.Label("Objective:"),
+            dcc.RadioItems(
+                id='squad-objective',
+                options=[{'label': OBJECTIVES[key], 'value': key} for key in objectives],
+                value='points',
+                inline=True
+            )
+        ]),
+        html.Div([
+            html.Label("Budget:"),
+            dcc.Input(id='squad-budget', type='number', value=SQUAD_BUDGET, min=0, step=5,
+                      style={'width': '100px', 'margin-left': '5px'})
+        ], style={'margin-bottom': '10px'}),
+        html.Div([
+            html.Label("Filter by GW:"),
+            dcc.RangeSlider(
+                id='squad-gw-range',
+                min=df['GW'].min(),
+                max=df['GW'].max(),
+                value=[df['GW'].min(), df['GW'].max()],
+                marks={i: str(i) for i in [int(df['GW'].min()), int(df['GW'].max())]}
+            )
+        ]),
+        html.Div(id='squad-summary', style={'margin': '10px 0', 'font-weight': 'bold'}),
+        dash_table.DataTable(
+            id='squad-table',
+            columns=[{'name': col, 'id': col} for col in ['role', 'name', 'position', 'team', 'value', 'score']],
+            style_cell={'textAlign': 'left', 'fontSize': '12px'},
+            style_header={'backgroundColor': 'white', 'fontWeight': 'bold'},
+            style_data_conditional=[{'if': {'filter_query': '{role} = "Bench"'}, 'color': 'grey'}]
+        )
+    ])
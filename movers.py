@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+# Columns that are a snapshot per GW (take the last row of a double GW) and
+# columns that are a flow per fixture (summed over a double GW)
+LEVEL_COLUMNS = ['value', 'selected']
+FLOW_COLUMNS = ['transfers_balance']
+
+
+class Movers:
+    def __init__(self, df):
+        self.min_gw = int(df['GW'].min())
+        self.max_gw = int(df['GW'].max())
+        gws = pd.RangeIndex(self.min_gw, self.max_gw + 1, name='GW')
+
+        df = df.sort_values('GW', kind='stable')
+        grouped = df.groupby(['name', 'GW'], observed=True)
+        levels = grouped[LEVEL_COLUMNS].last()
+        flows = grouped[FLOW_COLUMNS].sum()
+
+        # player x GW matrices, NaN where a player has no row in a GW
+        self.matrices = {}
+        for col in LEVEL_COLUMNS:
+            self.matrices[col] = levels[col].unstack('GW').reindex(columns=gws)
+        for col in FLOW_COLUMNS:
+            self.matrices[col] = flows[col].unstack('GW').reindex(columns=gws)
+        self.players = self.matrices[LEVEL_COLUMNS[0]].index
+        self.positions = df.groupby('name', observed=True)['position'].last().reindex(self.players)
+
+    def _window(self, column, start_gw, end_gw):
+        start = max(int(start_gw), self.min_gw) - self.min_gw
+        end = min(int(end_gw), self.max_gw) - self.min_gw + 1
+        return self.matrices[column].to_numpy(dtype='float64')[:, start:max(start, end)]
+
+    def changes(self, column, start_gw, end_gw):
+        # Each player's change over the range, from their first GW in the range
+        # to their last, so players missing at either end still count
+        window = self._window(column, start_gw, end_gw)
+        present = ~np.isnan(window)
+        seen = present.any(axis=1)
+        rows = np.arange(len(window))
+        first = window[rows, present.argmax(axis=1)] if window.size else np.full(len(window), np.nan)
+        last = window[rows, window.shape[1] - 1 - present[:, ::-1].argmax(axis=1)] if window.size else first
+
+        result = pd.DataFrame({
+            'name': self.players.astype(str),
+            'position': self.positions.to_numpy(),
+            'start': first,
+            'end': last,
+            'change': last - first,
+        })
+        return result[seen].reset_index(drop=True)
+
+    def totals(self, column, start_gw, end_gw):
+        # Flow columns summed over the range
+        window = self._window(column, start_gw, end_gw)
+        seen = ~np.isnan(window).all(axis=1) if window.size else np.zeros(len(window), dtype=bool)
+        result = pd.DataFrame({
+            'name': self.players.astype(str),
+            'position': self.positions.to_numpy(),
+            'total': np.nansum(window, axis=1),
+        })
+        return result[seen].reset_index(drop=True)
+
+    def deltas(self, column, start_gw, end_gw):
+        # GW-on-GW change per player, NaN where either GW is missing
+        start = max(int(start_gw), self.min_gw)
+        matrix = self.matrices[column].loc[:, start:int(end_gw)]
+        return matrix.diff(axis=1).iloc[:, 1:]
+
+    def top(self, column, start_gw, end_gw, k=20, fallers=False):
+        if column in FLOW_COLUMNS:
+            result, by = self.totals(column, start_gw, end_gw), 'total'
+        else:
+            result, by = self.changes(column, start_gw, end_gw), 'change'
+        # Only players who actually moved that way, a short window may have
+        # fewer than k
+        result = result[result[by] < 0] if fallers else result[result[by] > 0]
+        return result.sort_values(by, ascending=fallers, kind='stable').head(k)
+
+
+def get_movers(data):
+    return data.derived('movers', Movers)
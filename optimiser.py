@@ -0,0 +1,298 @@
+import importlib.util
+import os
+
+import numpy as np
+import pandas as pd
+
+# scipy's MILP solver gives exact squads with every rule enforced, but scipy is
+# optional so fall back to a budget DP when it isn't installed. It's slow to
+# import, so that waits for the first squad that needs it.
+SOLVER = 'milp' if importlib.util.find_spec('scipy') is not None else 'dp'
+
+# Squad rules, values are in the dataset's units (tenths of £1m)
+SQUAD_BUDGET = int(os.environ.get('FPL_SQUAD_BUDGET', '1000'))
+SQUAD_QUOTAS = {'GK': 2, 'DEF': 5, 'MID': 5, 'FWD': 3}
+MAX_PER_TEAM = 3
+# Starting XI: (min, max) per position, 11 in total
+XI_LIMITS = {'GK': (1, 1), 'DEF': (3, 5), 'MID': (2, 5), 'FWD': (1, 3)}
+XI_SIZE = 11
+# Bench players still count a little, so the bench isn't filled with zeros
+# when a slightly better one is affordable
+BENCH_WEIGHT = 0.1
+
+OBJECTIVES = {
+    'points': 'Total points',
+    'xP': 'Expected points',
+    'value': 'Points per £1m',
+}
+
+
+def player_pool(cumulative, start_gw, end_gw, objective):
+    # One row per player seen in the window: latest position, team and value
+    # plus the score being maximised
+    sum_columns = ['total_points'] + (['xP'] if cumulative.has_stats(['xP']) else [])
+    if objective == 'xP' and 'xP' not in sum_columns:
+        raise ValueError('This season has no xP column')
+    pool = (cumulative.window_frame(start_gw, end_gw, sum_columns, ['position', 'team', 'value'])
+                      .rename_axis('name').reset_index())
+    pool = pool[pool['position'].isin(list(SQUAD_QUOTAS)) & (pool['value'] > 0)]
+
+    if objective == 'value':
+        pool['score'] = pool['total_points'] / (pool['value'] / 10)
+    elif objective == 'xP':
+        pool['score'] = pool['xP'].astype('float64')
+    else:
+        pool['score'] = pool['total_points'].astype('float64')
+    pool['value'] = pool['value'].astype('int64')
+    for col in ['name', 'position', 'team']:
+        pool[col] = pool[col].astype(str)
+    return prune_pool(pool.reset_index(drop=True))
+
+
+def prune_pool(pool):
+    # Drop players who can never be needed. If q costs no more and scores no
+    # less than p, swapping p for q keeps any squad valid unless q is already
+    # in it or q's team is full. With p in the squad at most quota - 1 others
+    # share p's position and at most 4 other teams are full, so dominators
+    # from quota + 4 different teams guarantee a free one.
+    keep = np.zeros(len(pool), dtype=bool)
+    for position, quota in SQUAD_QUOTAS.items():
+        rows = np.flatnonzero(pool['position'].to_numpy() == position)
+        value = pool['value'].to_numpy()[rows]
+        score = pool['score'].to_numpy()[rows]
+        # Ties go to the earlier row so two identical players can't knock each other out
+        order = np.arange(len(rows))
+        dominates = ((value[None, :] <= value[:, None]) & (score[None, :] >= score[:, None])
+                     & ((value[None, :] < value[:, None]) | (score[None, :] > score[:, None])
+                        | (order[None, :] < order[:, None])))
+        teams = pd.factorize(pool['team'].to_numpy()[rows])[0]
+        team_members = np.zeros((len(rows), teams.max() + 1 if len(rows) else 0))
+        team_members[np.arange(len(rows)), teams] = 1
+        dominating_teams = ((dominates.astype('float64') @ team_members) > 0).sum(axis=1)
+        keep[rows[dominating_teams < quota + 4]] = True
+    return pool[keep].reset_index(drop=True)
+
+
+def pick_starting_xi(positions, scores):
+    # Best XI from a 15-man squad: the required minimum per position first,
+    # then the best of the rest up to each position's maximum
+    order = np.argsort(-scores, kind='stable')
+    starting = np.zeros(len(scores), dtype=bool)
+    counts = dict.fromkeys(XI_LIMITS, 0)
+    for row in order:
+        if counts[positions[row]] < XI_LIMITS[positions[row]][0]:
+            starting[row] = True
+            counts[positions[row]] += 1
+    for row in order:
+        if starting.sum() == XI_SIZE:
+            break
+        if not starting[row] and counts[positions[row]] < XI_LIMITS[positions[row]][1]:
+            starting[row] = True
+            counts[positions[row]] += 1
+    return starting
+
+
+def squad_score(scores, starting):
+    return float(scores[starting].sum() + BENCH_WEIGHT * scores[~starting].sum())
+
+
+def solve_milp(pool, budget):
+    from scipy import sparse
+    from scipy.optimize import Bounds, LinearConstraint, milp
+
+    # Variables are [in squad] * n then [starting] * n
+    n = len(pool)
+    score = pool['score'].to_numpy()
+    positions = pool['position'].to_numpy()
+    rows, lower, upper = [], [], []
+
+    def add(coefficients, low, high):
+        rows.append(coefficients)
+        lower.append(low)
+        upper.append(high)
+
+    zeros = np.zeros(n)
+    add(np.concatenate([pool['value'].to_numpy(dtype='float64'), zeros]), 0, budget)
+    add(np.concatenate([zeros, np.ones(n)]), XI_SIZE, XI_SIZE)
+    for position, quota in SQUAD_QUOTAS.items():
+        members = (positions == position).astype('float64')
+        add(np.concatenate([members, zeros]), quota, quota)
+        add(np.concatenate([zeros, members]), *XI_LIMITS[position])
+    for team in np.unique(pool['team'].to_numpy()):
+        add(np.concatenate([(pool['team'].to_numpy() == team).astype('float64'), zeros]), 0, MAX_PER_TEAM)
+    # Only squad players can start
+    starts_in_squad = sparse.hstack([-sparse.eye(n), sparse.eye(n)], format='csr')
+
+    result = milp(
+        c=-np.concatenate([BENCH_WEIGHT * score, (1 - BENCH_WEIGHT) * score]),
+        constraints=[LinearConstraint(sparse.csr_array(np.array(rows)), lower, upper),
+                     LinearConstraint(starts_in_squad, -np.inf, 0)],
+        integrality=np.ones(2 * n),
+        bounds=Bounds(0, 1),
+    )
+    if result.x is None:
+        return None
+    return np.flatnonzero(result.x[:n] > 0.5)
+
+
+def _position_dp(cost, score, quota, budget):
+    # best[s, b, c]: best score from s starters and b bench players of this
+    # position costing exactly c, plus which player changed each state
+    best = np.full((quota + 1, quota + 1, budget + 1), -np.inf)
+    best[0, 0, 0] = 0
+    took_start, took_bench = [], []
+    for c, v in zip(cost, score):
+        if c > budget:
+            took_start.append(None)
+            took_bench.append(None)
+            continue
+        start = np.full_like(best, -np.inf)
+        start[1:, :, c:] = best[:-1, :, :budget + 1 - c] + v
+        bench = np.full_like(best, -np.inf)
+        bench[:, 1:, c:] = best[:, :-1, :budget + 1 - c] + BENCH_WEIGHT * v
+        took_start.append(start > best)
+        best = np.maximum(best, start)
+        took_bench.append(bench > best)
+        best = np.maximum(best, bench)
+    return best, took_start, took_bench
+
+
+def _position_players(cost, took_start, took_bench, starters, bench, spent):
+    chosen = []
+    for i in range(len(cost) - 1, -1, -1):
+        if took_bench[i] is not None and took_bench[i][starters, bench, spent]:
+            bench -= 1
+        elif took_start[i] is not None and took_start[i][starters, bench, spent]:
+            starters -= 1
+        else:
+            continue
+        chosen.append(i)
+        spent -= cost[i]
+    return chosen
+
+
+def _max_plus(a, b):
+    # c[k] = max(a[i] + b[k - i]), with the split i that achieved it
+    combined = np.full_like(a, -np.inf)
+    split = np.zeros(len(a), dtype='int64')
+    for i in np.flatnonzero(np.isfinite(a)):
+        candidate = a[i] + b[:len(a) - i]
+        better = candidate > combined[i:]
+        combined[i:][better] = candidate[better]
+        split[i:][better] = i
+    return combined, split
+
+
+def solve_dp(pool, budget):
+    # Exact for everything but the per-team limit: a budget DP per position,
+    # then the positions combined over every valid formation. Usually faster
+    # than the MILP, which is only needed when the team limit binds.
+    # No squad costs more than the priciest players each quota allows, so
+    # a larger budget only grows the tables
+    positions = pool['position'].to_numpy()
+    values = pool['value'].to_numpy()
+    budget = min(budget, sum(int(np.sort(values[positions == position])[::-1][:quota].sum())
+                             for position, quota in SQUAD_QUOTAS.items()))
+    if budget < 0:
+        return None
+
+    tables = {}
+    for position, quota in SQUAD_QUOTAS.items():
+        rows = np.flatnonzero(pool['position'].to_numpy() == position)
+        cost = pool['value'].to_numpy()[rows]
+        best, took_start, took_bench = _position_dp(cost, pool['score'].to_numpy()[rows], quota, budget)
+        tables[position] = (rows, cost, best, took_start, took_bench)
+
+    def by_starters(position, starters):
+        return tables[position][2][starters, SQUAD_QUOTAS[position] - starters]
+
+    best_total, best_choice = -np.inf, None
+    for gk in range(XI_LIMITS['GK'][0], XI_LIMITS['GK'][1] + 1):
+        for defs in range(XI_LIMITS['DEF'][0], XI_LIMITS['DEF'][1] + 1):
+            back, back_split = _max_plus(by_starters('GK', gk), by_starters('DEF', defs))
+            for mids in range(XI_LIMITS['MID'][0], XI_LIMITS['MID'][1] + 1):
+                fwds = XI_SIZE - gk - defs - mids
+                if not XI_LIMITS['FWD'][0] <= fwds <= XI_LIMITS['FWD'][1]:
+                    continue
+                middle, middle_split = _max_plus(back, by_starters('MID', mids))
+                total, total_split = _max_plus(middle, by_starters('FWD', fwds))
+                spent = int(np.argmax(total))
+                if total[spent] > best_total:
+                    best_total = total[spent]
+                    best_choice = (gk, defs, mids, fwds, spent, back_split, middle_split, total_split)
+    if best_choice is None or not np.isfinite(best_total):
+        return None
+
+    # Walk the splits back to each position's spend, then to its players
+    gk, defs, mids, fwds, spent, back_split, middle_split, total_split = best_choice
+    spends = {}
+    spends['FWD'] = spent - total_split[spent]
+    spent = total_split[spent]
+    spends['MID'] = spent - middle_split[spent]
+    spent = middle_split[spent]
+    spends['DEF'] = spent - back_split[spent]
+    spends['GK'] = back_split[spent]
+
+    chosen = []
+    for position, starters in [('GK', gk), ('DEF', defs), ('MID', mids), ('FWD', fwds)]:
+        rows, cost, _, took_start, took_bench = tables[position]
+        picks = _position_players(cost, took_start, took_bench, starters,
+                                  SQUAD_QUOTAS[position] - starters, int(spends[position]))
+        chosen += list(rows[picks])
+    return np.array(chosen)
+
+
+def within_team_limits(pool, chosen):
+    return pool['team'].iloc[chosen].value_counts().max() <= MAX_PER_TEAM
+
+
+def repair_team_limits(pool, chosen, budget):
+    # Without scipy: swap players out of over-full teams, each time making the
+    # swap that costs the least score, until every team is within MAX_PER_TEAM.
+    # Close to optimal, but not guaranteed.
+    chosen = list(chosen)
+    teams = pool['team'].to_numpy()
+    positions = pool['position'].to_numpy()
+    values = pool['value'].to_numpy()
+    scores = pool['score'].to_numpy()
+    while True:
+        counts = pd.Series(teams[chosen]).value_counts()
+        if counts.max() <= MAX_PER_TEAM:
+            return np.array(chosen)
+        full = set(counts.index[counts >= MAX_PER_TEAM])
+        over = set(counts.index[counts > MAX_PER_TEAM])
+        remaining = budget - values[chosen].sum()
+
+        best = None
+        for out in [row for row in chosen if teams[row] in over]:
+            candidates = np.flatnonzero((positions == positions[out]) & ~np.isin(np.arange(len(pool)), chosen)
+                                        & ~np.isin(teams, list(full)) & (values <= values[out] + remaining))
+            for row in candidates:
+                squad = [r for r in chosen if r != out] + [row]
+                score = squad_score(scores[squad], pick_starting_xi(positions[squad], scores[squad]))
+                if best is None or score > best[0]:
+                    best = (score, out, row)
+        if best is None:
+            return None
+        chosen = [r for r in chosen if r != best[1]] + [best[2]]
+
+
+def optimise_squad(pool, budget=SQUAD_BUDGET, solver=None):
+    # Best squad and starting XI from player_pool's rows, or None when no
+    # valid squad fits the budget. attrs['solver'] records how it was found.
+    solver = solver or SOLVER
+    chosen, used = solve_dp(pool, budget), 'dp'
+    if chosen is not None and not within_team_limits(pool, chosen):
+        if solver == 'milp':
+            chosen, used = solve_milp(pool, budget), 'milp'
+        else:
+            chosen, used = repair_team_limits(pool, chosen, budget), 'dp+repair'
+    if chosen is None or len(chosen) != sum(SQUAD_QUOTAS.values()):
+        return None
+
+    squad = pool.iloc[chosen].copy()
+    squad['starting'] = pick_starting_xi(squad['position'].to_numpy(), squad['score'].to_numpy())
+    squad['position'] = pd.Categorical(squad['position'], categories=list(SQUAD_QUOTAS), ordered=True)
+    squad = squad.sort_values(['starting', 'position', 'score'], ascending=[False, True, False]).reset_index(drop=True)
+    squad.attrs['solver'] = used
+    return squad
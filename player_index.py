@@ -0,0 +1,34 @@
+import numpy as np
+
+
+class PlayerIndex:
+    def __init__(self, df):
+        # Sort by player then GW so every player's history is one contiguous block
+        self.df = df.sort_values(['name', 'GW'], kind='stable').reset_index(drop=True)
+
+        names = self.df['name'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]])
+        stops = np.r_[starts[1:], len(names)]
+        self.slices = {names[start]: (start, stop) for start, stop in zip(starts, stops)}
+        self._columns = {}
+
+    def __contains__(self, player):
+        return player in self.slices
+
+    def column(self, stat):
+        # NumPy copy of a whole column, built on first use
+        if stat not in self._columns:
+            self._columns[stat] = self.df[stat].to_numpy()
+        return self._columns[stat]
+
+    def values(self, player, stat):
+        start, stop = self.slices.get(player, (0, 0))
+        return self.column(stat)[start:stop]
+
+    def rows(self, player):
+        start, stop = self.slices.get(player, (0, 0))
+        return self.df.iloc[start:stop]
+
+
+def get_player_index(data):
+    return data.derived('player_index', PlayerIndex)
@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from player_index import get_player_index
+
+# Number of lookback values kept per dataset version
+MAX_CACHED_LOOKBACKS = 8
+
+
+class RollingStats:
+    def __init__(self, player_index):
+        self.player_index = player_index
+        df = player_index.df
+        self.stats = list(df.select_dtypes('number').columns)
+        self._column_positions = {stat: i for i, stat in enumerate(self.stats)}
+
+        # Prefix sums over every numeric column at once, padded with a zero row
+        values = df[self.stats].to_numpy(dtype='float64')
+        present = ~np.isnan(values)
+        self._sums = np.vstack([np.zeros(len(self.stats)), np.cumsum(np.where(present, values, 0), axis=0)])
+        self._counts = np.vstack([np.zeros(len(self.stats)), np.cumsum(present, axis=0)])
+
+        # Row position where each row's player block starts
+        self._block_starts = np.zeros(len(df), dtype='int64')
+        for start, stop in player_index.slices.values():
+            self._block_starts[start:stop] = start
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _compute(self, lookback):
+        # Window of each row, clipped to the start of that player's block
+        stops = np.arange(1, len(self._block_starts) + 1)
+        starts = np.maximum(stops - lookback, self._block_starts)
+        counts = self._counts[stops] - self._counts[starts]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = (self._sums[stops] - self._sums[starts]) / counts
+        # Differences of long running sums pick up float noise in the last digits
+        return np.round(means, 9)
+
+    def means(self, lookback):
+        with self._lock:
+            if lookback in self._cache:
+                self._cache.move_to_end(lookback)
+                return self._cache[lookback]
+
+        means = self._compute(lookback)
+        with self._lock:
+            self._cache[lookback] = means
+            if len(self._cache) > MAX_CACHED_LOOKBACKS:
+                self._cache.popitem(last=False)
+        return means
+
+    def values(self, player, stat, lookback):
+        start, stop = self.player_index.slices.get(player, (0, 0))
+        return self.means(lookback)[start:stop, self._column_positions[stat]]
+
+
+def get_rolling_stats(data):
+    return data.derived('rolling_stats', lambda df: RollingStats(get_player_index(data)))
@@ -0,0 +1,90 @@
+import glob
+import os
+import threading
+
+from dataset import Dataset
+from fetch import run_parallel
+
+# Where each season's merged_gw.csv lives upstream
+SEASON_URL_TEMPLATE = os.environ.get(
+    'FPL_SEASON_URL_TEMPLATE',
+    'https://github.com/vaastav/Fantasy-Premier-League/blob/master/data/{season}/gws/merged_gw.csv?raw=true'
+)
+
+# Seasons fetched from SEASON_URL_TEMPLATE. Earlier seasons lack the team and
+# position columns the app relies on.
+SEASONS = [season for season in os.environ.get('FPL_SEASONS', '2020-21,2021-22,2022-23,2023-24').split(',')
+           if season]
+DEFAULT_SEASON = os.environ.get('FPL_DEFAULT_SEASON', '2023-24')
+# Further seasons to load in parallel with the default one at startup
+PRELOAD_SEASONS = [season for season in os.environ.get('FPL_PRELOAD_SEASONS', '').split(',') if season]
+
+# Optional local copy laid out like the upstream repo, <season>/gws/merged_gw.csv.
+# Seasons found there take precedence over the URLs.
+DATA_DIR = os.environ.get('FPL_DATA_DIR')
+
+
+class SeasonRegistry:
+    # Maps season names to their source and loads each one on first access
+
+    def __init__(self):
+        self._sources = {}
+        self._datasets = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def register(self, season, source):
+        self._sources[season] = source
+
+    def add_listener(self, listener):
+        # listener(season) after each season's first load and every refresh
+        with self._lock:
+            self._listeners.append(listener)
+            for season, data in self._datasets.items():
+                data.add_listener(lambda season=season: listener(season))
+
+    def seasons(self):
+        return sorted(self._sources)
+
+    def get(self, season=None):
+        season = season or DEFAULT_SEASON
+        if season not in self._sources:
+            raise KeyError(f'Unknown season {season!r}')
+
+        with self._lock:
+            data = self._datasets.get(season)
+            if data is None:
+                data = self._datasets[season] = Dataset(self._sources[season])
+                for listener in self._listeners:
+                    data.add_listener(lambda listener=listener: listener(season))
+        data.load()
+        # Only the current season still gets new gameweeks, and local copies
+        # don't change underneath us
+        if season == DEFAULT_SEASON and not os.path.isfile(data.url):
+            data.start_refresher()
+        return data
+
+    def preload(self, seasons):
+        # Fetch and parse several seasons concurrently
+        run_parallel(self.get, dict.fromkeys(seasons))
+
+    def loaded_seasons(self):
+        return [season for season, data in self._datasets.items() if data.df is not None]
+
+
+def build_registry():
+    registry = SeasonRegistry()
+    for season in SEASONS:
+        registry.register(season, SEASON_URL_TEMPLATE.format(season=season))
+    if DATA_DIR:
+        for path in glob.glob(os.path.join(DATA_DIR, '*', 'gws', 'merged_gw.csv')):
+            registry.register(os.path.basename(os.path.dirname(os.path.dirname(path))), path)
+    return registry
+
+
+registry = build_registry()
+
+
+def get_dataset(season=None):
+    return registry.get(season)
+
@@ -0,0 +1,86 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+
+import pyarrow as pa
+
+
+class SharedStore:
+    # One process writes the frame to an uncompressed Arrow IPC file, every
+    # worker memory-maps it. Numeric columns come back as read-only views
+    # of the shared pages instead of private copies.
+
+    def __init__(self, directory, url):
+        self.directory = directory
+        self.key = hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]
+        os.makedirs(directory, exist_ok=True)
+        self._pointer_path = os.path.join(directory, f'{self.key}.current')
+        self._lock_path = os.path.join(directory, f'{self.key}.lock')
+
+    @contextlib.contextmanager
+    def lock(self, blocking=True):
+        # Yields whether this process got the lock, only possible False when
+        # not blocking
+        with open(self._lock_path, 'a') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_pointer(self):
+        try:
+            with open(self._pointer_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def published_version(self):
+        pointer = self._read_pointer()
+        return pointer['version'] if pointer else None
+
+    def publish(self, df, extends=None, source=None):
+        # Call with the lock held. extends is the row count of the published
+        # frame that df extends by appending rows, None otherwise. source
+        # holds the upstream etag, last_modified and content_hash, so workers
+        # that only attach can still send conditional requests.
+        previous = self.published_version()
+        version = (previous or 0) + 1
+        file_name = f'{self.key}-{version}.arrow'
+        path = os.path.join(self.directory, file_name)
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(path + '.tmp', 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(path + '.tmp', path)
+
+        tmp_pointer = self._pointer_path + '.tmp'
+        with open(tmp_pointer, 'w') as f:
+            json.dump({
+                'version': version,
+                'file': file_name,
+                'extends': [previous, extends] if previous is not None and extends is not None else None,
+                'source': source or {},
+            }, f)
+        os.replace(tmp_pointer, self._pointer_path)
+
+        # Workers still mapping an older file keep it alive after the unlink
+        for name in os.listdir(self.directory):
+            if name.startswith(f'{self.key}-') and name.endswith('.arrow') and name != file_name:
+                os.remove(os.path.join(self.directory, name))
+        return version
+
+    def attach(self):
+        # (pointer, frame). The pointer has the version, the [version, row
+        # count] of the frame it extends or None, and the source details.
+        pointer = self._read_pointer()
+        source = pa.memory_map(os.path.join(self.directory, pointer['file']), 'r')
+        table = pa.ipc.open_file(source).read_all()
+        return pointer, table.to_pandas(split_blocks=True)
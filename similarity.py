@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+# Stats compared per 90 minutes, any missing from a season are skipped
+SIMILARITY_STATS = [
+    'ict_index', 'influence', 'creativity', 'threat', 'xP', 'bps', 'total_points',
+    'expected_goals', 'expected_assists', 'expected_goals_conceded',
+    'goals_scored', 'assists', 'clean_sheets', 'saves',
+]
+# Per-90 rates over fewer minutes than this are too noisy to suggest
+MIN_MINUTES = 270
+LATEST_COLUMNS = ['position', 'team', 'value']
+
+
+class SimilarityIndex:
+    def __init__(self, df=None, totals=None, latest=None):
+        # Season totals and latest details per player, either summed from a
+        # whole frame or carried over by extend
+        if df is not None:
+            self.stats = [stat for stat in SIMILARITY_STATS if stat in df.columns]
+            totals, latest = self._summarise(df, self.stats)
+        else:
+            self.stats = [stat for stat in totals.columns if stat != 'minutes']
+        self.totals = totals
+        self.latest = latest
+        self._build_vectors()
+
+    @staticmethod
+    def _summarise(df, stats):
+        grouped = df.groupby('name', observed=True, sort=False)
+        totals = grouped[stats + ['minutes']].sum().astype('float64')
+        latest = (df.sort_values('GW', kind='stable').groupby('name', observed=True, sort=False)[LATEST_COLUMNS]
+                    .last().reindex(totals.index))
+        latest = latest.astype({'position': str, 'team': str, 'value': 'int64'})
+        totals.index = totals.index.astype(str)
+        latest.index = latest.index.astype(str)
+        return totals, latest
+
+    def extend(self, new_rows):
+        # New index with appended gameweeks folded into the running totals,
+        # so only the new rows are scanned
+        if new_rows.empty:
+            return self
+        totals, latest = self._summarise(new_rows, self.stats)
+        totals = self.totals.add(totals, fill_value=0)
+        latest = pd.concat([self.latest.drop(latest.index, errors='ignore'), latest]).loc[totals.index]
+        return SimilarityIndex(totals=totals, latest=latest)
+
+    def _build_vectors(self):
+        # Per-90 rates z-scored against the players with enough minutes
+        minutes = self.totals['minutes'].to_numpy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rates = self.totals[self.stats].to_numpy() / minutes[:, None] * 90
+        rates = np.nan_to_num(rates, nan=0.0, posinf=0.0, neginf=0.0)
+
+        self.eligible = minutes >= MIN_MINUTES
+        reference = rates[self.eligible] if self.eligible.any() else rates
+        mean = reference.mean(axis=0) if len(reference) else 0
+        std = reference.std(axis=0) if len(reference) else 1
+        self.vectors = (rates - mean) / np.where(std > 0, std, 1)
+
+        self.players = self.totals.index
+        self._positions = {player: i for i, player in enumerate(self.players)}
+        self.position = self.latest['position'].to_numpy()
+        self.value = self.latest['value'].to_numpy()
+
+    def __contains__(self, player):
+        return player in self._positions
+
+    def similar(self, player, k=10, positions=None, value_range=None):
+        # k nearest players with enough minutes, by default in the same
+        # position, optionally limited to a value band
+        if player not in self._positions:
+            return pd.DataFrame(columns=['name'] + LATEST_COLUMNS + ['distance'])
+        i = self._positions[player]
+        candidates = self.eligible.copy()
+        candidates[i] = False
+        candidates &= np.isin(self.position, positions or [self.position[i]])
+        if value_range is not None:
+            candidates &= (self.value >= value_range[0]) & (self.value <= value_range[1])
+
+        rows = np.flatnonzero(candidates)
+        distances = np.sqrt(((self.vectors[rows] - self.vectors[i]) ** 2).sum(axis=1))
+        if len(rows) > k:
+            nearest = np.argpartition(distances, k)[:k]
+            rows, distances = rows[nearest], distances[nearest]
+        order = np.argsort(distances, kind='stable')
+
+        result = self.latest.iloc[rows[order]].rename_axis('name').reset_index()
+        result['distance'] = distances[order]
+        return result
+
+
+def get_similarity_index(data):
+    return data.derived('similarity_index', SimilarityIndex, update=SimilarityIndex.extend)
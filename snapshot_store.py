@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+# Directory holding one sub-directory per source URL. Point this at a seeded
+# copy to run fully offline.
+SNAPSHOT_DIR = os.environ.get(
+    'FPL_SNAPSHOT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.snapshots')
+)
+
+# Parquet keeps the categoricals and is much faster to load than the CSV, but
+# pyarrow is optional so fall back to pickle when it isn't installed.
+try:
+    import pyarrow  # noqa: F401
+    SNAPSHOT_FORMAT = 'parquet'
+except ImportError:
+    SNAPSHOT_FORMAT = 'pickle'
+
+
+def _url_dir(url):
+    return os.path.join(SNAPSHOT_DIR, hashlib.sha256(url.encode('utf-8')).hexdigest()[:16])
+
+
+def _manifest_path(url):
+    return os.path.join(_url_dir(url), 'manifest.json')
+
+
+def content_hash(raw_data):
+    return hashlib.sha256(raw_data).hexdigest()
+
+
+def read_manifest(url):
+    try:
+        with open(_manifest_path(url)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_snapshot(url):
+    manifest = read_manifest(url)
+    if manifest is None:
+        return None
+
+    path = os.path.join(_url_dir(url), manifest['file'])
+    try:
+        if manifest['format'] == 'parquet':
+            return pd.read_parquet(path)
+        return pd.read_pickle(path)
+    except (OSError, ImportError, ValueError):
+        # A missing or unreadable snapshot just means a cold fetch
+        return None
+
+
+def save_snapshot(url, df, digest, etag=None, last_modified=None):
+    url_dir = _url_dir(url)
+    os.makedirs(url_dir, exist_ok=True)
+
+    file_name = f'{digest[:16]}.{SNAPSHOT_FORMAT}'
+    path = os.path.join(url_dir, file_name)
+    if not os.path.exists(path):
+        # Temp files are unique per writer, as every worker may save at once
+        # on a cold start
+        fd, tmp_path = tempfile.mkstemp(dir=url_dir, suffix='.tmp')
+        os.close(fd)
+        if SNAPSHOT_FORMAT == 'parquet':
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+
+    manifest = {
+        'url': url,
+        'file': file_name,
+        'format': SNAPSHOT_FORMAT,
+        'content_hash': digest,
+        'etag': etag,
+        'last_modified': last_modified,
+    }
+    fd, tmp_manifest = tempfile.mkstemp(dir=url_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_manifest, _manifest_path(url))
+
+    # Drop snapshots superseded by this one, which another worker may be
+    # doing at the same time
+    for name in os.listdir(url_dir):
+        if name != file_name and name != 'manifest.json' and not name.endswith('.tmp'):
+            try:
+                os.remove(os.path.join(url_dir, name))
+            except FileNotFoundError:
+                pass
+
+
+def seed_snapshot(url, csv_path):
+    # Build a snapshot for url from a local copy of the CSV, e.g. on a machine
+    # without network access
+    from data_handler import process_data
+
+    with open(csv_path, 'rb') as f:
+        raw_data = f.read()
+    save_snapshot(url, process_data(raw_data), content_hash(raw_data))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit('usage: python snapshot_store.py <merged_gw.csv> <url>')
+    seed_snapshot(sys.argv[2], sys.argv[1])
@@ -0,0 +1,41 @@
+import logging
+import os
+import threading
+
+from flask import jsonify
+
+from seasons import DEFAULT_SEASON, PRELOAD_SEASONS, registry
+
+logger = logging.getLogger(__name__)
+
+# FPL_LAZY_STARTUP=1 lets the server bind straight away and load the data in
+# the background, with /ready answering 503 until the default season is in
+LAZY_STARTUP = os.environ.get('FPL_LAZY_STARTUP') == '1'
+
+
+def preload():
+    # Fetch and process the default season (plus any preloads, in parallel),
+    # others load when first selected
+    registry.preload([DEFAULT_SEASON] + PRELOAD_SEASONS)
+
+
+def ready():
+    loaded = registry.loaded_seasons()
+    status = 200 if DEFAULT_SEASON in loaded else 503
+    return jsonify(ready=status == 200, seasons=sorted(loaded)), status
+
+
+def install(app):
+    app.server.add_url_rule('/ready', 'ready', ready)
+    if not LAZY_STARTUP:
+        preload()
+        return
+
+    def run():
+        try:
+            preload()
+        except Exception:
+            # /ready stays 503 and the first request tries the load again
+            logger.exception('Background preload failed')
+
+    threading.Thread(target=run, name='preload', daemon=True).start()
@@ -0,0 +1,76 @@
+import logging
+import os
+import threading
+import time
+
+import callbacks
+from seasons import registry
+
+logger = logging.getLogger(__name__)
+
+# Precompute every tab's default outputs after each load and refresh, so the
+# first request of every session is a cache hit. FPL_WARMUP=0 turns it off.
+ENABLED = os.environ.get('FPL_WARMUP', '1') != '0'
+
+TABS = ['tab-graphs', 'tab-tables', 'tab-overview', 'tab-squad']
+
+
+def layout_props(component, props=None):
+    # {id: component} for every component with an id in a layout tree
+    props = {} if props is None else props
+    if getattr(component, 'id', None) is not None:
+        props[component.id] = component
+    children = getattr(component, 'children', None)
+    for child in children if isinstance(children, (list, tuple)) else [children]:
+        if hasattr(child, 'to_plotly_json'):
+            layout_props(child, props)
+    return props
+
+
+def warm(season):
+    # Call each callback with the values its controls start with, exactly as
+    # a fresh page load would, which fills the callbacks' own caches
+    start = time.perf_counter()
+    for tab in TABS:
+        components = layout_props(callbacks.render_content(tab, season))
+
+        def value(component_id, default=None):
+            return getattr(components[component_id], 'value', default)
+
+        if 'graphs-container' in components:
+            callbacks.update_graphs(value('player-dropdown'), value('stat-dropdown'), value('trailing-lookback'),
+                                    value('toggle-trailing'), value('num-cols-input'), season)
+        if 'similar-table' in components:
+            callbacks.update_similar_players(value('player-dropdown'), value('similar-price-band'),
+                                             value('similar-same-position'), season)
+        if 'configurable-table' in components:
+            table = components['configurable-table']
+            callbacks.update_table(value('column-select'), value('value-range-slider'), value('GW-range-slider'),
+                                   value('position-filter'), value('sort-by-select'), value('sort-order'),
+                                   table.page_current, table.page_size, table.sort_by, table.filter_query, season)
+        if 'overview-weeks-input' in components:
+            callbacks.update_overview_tables(value('overview-weeks-input'), season)
+            callbacks.update_movers_tables(value('overview-weeks-input'), season)
+        if 'squad-table' in components:
+            callbacks.update_squad(value('squad-objective'), value('squad-budget'), value('squad-gw-range'), season)
+    logger.info('Warmed default views for %s in %.2fs', season, time.perf_counter() - start)
+
+
+def schedule(season):
+    # Off the loading thread, so startup and refreshes aren't held up
+    def run():
+        try:
+            warm(season)
+        except Exception:
+            logger.exception('Warm-up failed for %s', season)
+
+    threading.Thread(target=run, name='warmup', daemon=True).start()
+
+
+def install():
+    if not ENABLED:
+        return
+    registry.add_listener(schedule)
+    # Seasons preloaded before the listener was added
+    for season in registry.loaded_seasons():
+        schedule(season)